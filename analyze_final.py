@@ -4,38 +4,63 @@ Student ID: 280201055
 Final analysis script for evaluating experiment results.
 """
 
-import pandas as pd
+import argparse
 import glob
 import os
 import re
 import string
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+ANSWER_COLUMNS = ['model_answer', 'generated_answer']
+METRIC_COLUMNS = ANSWER_COLUMNS + ['ground_truth', 'retrieved_context_snippet', 'retrieval_method']
+# Parquet results reference their contexts in the document table of their folder
+PARQUET_COLUMNS = ANSWER_COLUMNS + ['ground_truth', 'retrieval_method', 'corpus', 'doc_id']
+DOCUMENT_TABLE = "documents.parquet"
+CHUNK_SIZE = 200_000
+
+_PUNCT_TABLE = str.maketrans('', '', string.punctuation)
+_ARTICLES_RE = re.compile(r'\b(a|an|the)\b')
+# Normalized form of every distinct text seen by this process
+_NORM_CACHE = {}
+_NORM_CACHE_LIMIT = 2_000_000
 
 
 def normalize_answer(s):
-    """Normalize text: lowercase, remove punctuation and extra whitespace."""
+    """Normalize text: lowercase, remove punctuation, articles and extra whitespace."""
     if not isinstance(s, str): 
         return ""
+    return ' '.join(_ARTICLES_RE.sub(' ', s.lower().translate(_PUNCT_TABLE)).split())
+
+def normalize_column(texts):
+    """
+    Normalize a column of strings exactly like normalize_answer.
+    Each distinct value is normalized once (with pandas string operations)
+    and remembered for later columns and files.
     
-    def remove_articles(text):
-        return re.sub(r'\b(a|an|the)\b', ' ', text)
-    
-    def white_space_fix(text):
-        return ' '.join(text.split())
-    
-    def remove_punc(text):
-        exclude = set(string.punctuation)
-        return ''.join(ch for ch in text if ch not in exclude)
-    
-    def lower(text):
-        return text.lower()
-    
-    return white_space_fix(remove_articles(remove_punc(lower(s))))
+    Returns:
+        Object array of normalized strings aligned with texts
+    """
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object))
+    missing = [u for u in uniques if u not in _NORM_CACHE]
+    if missing:
+        if len(_NORM_CACHE) + len(missing) > _NORM_CACHE_LIMIT:
+            _NORM_CACHE.clear()
+        normalized = (
+            pd.Series(missing, dtype=object)
+            .str.lower()
+            .str.translate(_PUNCT_TABLE)
+            .str.replace(_ARTICLES_RE, ' ', regex=True)
+            .str.split()
+            .str.join(' ')
+        )
+        _NORM_CACHE.update(zip(missing, normalized))
+    lookup = np.array([_NORM_CACHE[u] for u in uniques] + [""], dtype=object)
+    return lookup[codes]
 
-def f1_score(prediction, ground_truth):
-    """Calculate token-level F1 score (SQuAD standard)."""
-    prediction_tokens = normalize_answer(prediction).split()
-    ground_truth_tokens = normalize_answer(ground_truth).split()
+def _f1_from_tokens(prediction_tokens, ground_truth_tokens):
     common = Counter(prediction_tokens) & Counter(ground_truth_tokens)
     num_same = sum(common.values())
     
@@ -46,128 +71,286 @@ def f1_score(prediction, ground_truth):
     recall = 1.0 * num_same / len(ground_truth_tokens)
     return (2 * precision * recall) / (precision + recall)
 
-def calculate_all_metrics(df):
+def f1_score(prediction, ground_truth):
+    """Calculate token-level F1 score (SQuAD standard)."""
+    return _f1_from_tokens(normalize_answer(prediction).split(), normalize_answer(ground_truth).split())
+
+def f1_column(norm_preds, norm_truths):
+    """F1 for aligned normalized columns; every distinct (prediction, truth) pair is scored once."""
+    memo = {}
+    scores = []
+    for pair in zip(norm_preds, norm_truths):
+        score = memo.get(pair)
+        if score is None:
+            score = memo[pair] = _f1_from_tokens(pair[0].split(), pair[1].split())
+        scores.append(score)
+    return scores
+
+def _column_values(df, name):
+    """Values of a column, or None for every row when it is missing (like row.get)."""
+    if name in df.columns:
+        return df[name].tolist()
+    return [None] * len(df)
+
+
+class MetricAccumulator:
     """
-    Calculate five core metrics for all rows in DataFrame:
-    1. Retrieval Recall
-    2. Exact Match (EM)
-    3. F1 Score
-    4. Faithfulness
-    5. Gap (Grounded Hallucination Rate)
+    Collects the counts behind the five metrics chunk by chunk.
+    Every value is read exactly as the old per-row loop read it, and F1 scores
+    are summed in row order, so the results are identical to scoring the whole
+    file at once.
     """
-    total = len(df)
-    if total == 0:
-        return [0]*5
     
-    em_scores = []
-    f1_scores = []
-    faith_count = 0
-    recall_count = 0
+    def __init__(self):
+        self.total = 0
+        self.em_count = 0
+        self.f1_scores = []
+        self.faith_count = 0
+        self.recall_count = 0
     
-    for _, row in df.iterrows():
-        pred = str(row.get('model_answer') or row.get('generated_answer') or "")
+    def add(self, df):
+        """Score the rows of a DataFrame (or chunk) and add them to the counts."""
+        if len(df) == 0:
+            return
         
-        truth_raw = row.get('ground_truth')
-        truth = str(truth_raw).replace("['", "").replace("']", "").replace('["', '').replace('"]', '').split("', '")[0]
-        context = str(row.get('retrieved_context_snippet') or "")
+        preds = [str(a or b or "") for a, b in zip(_column_values(df, 'model_answer'), _column_values(df, 'generated_answer'))]
+        truths = [
+            str(t).replace("['", "").replace("']", "").replace('["', '').replace('"]', '').split("', '")[0]
+            for t in _column_values(df, 'ground_truth')
+        ]
+        # Parquet results carry the full retrieved context, CSV results a snippet
+        context_column = 'retrieved_context' if 'retrieved_context' in df.columns else 'retrieved_context_snippet'
+        contexts = [str(c or "") for c in _column_values(df, context_column)]
         
-        norm_pred = normalize_answer(pred)
-        norm_truth = normalize_answer(truth)
-        norm_context = normalize_answer(context)
+        norm_preds = normalize_column(preds)
+        norm_truths = normalize_column(truths)
+        norm_contexts = normalize_column(contexts)
         
+        self.total += len(df)
         # Exact Match
-        em_scores.append(1 if norm_pred == norm_truth else 0)
-        
+        self.em_count += int(np.count_nonzero(norm_preds == norm_truths))
         # F1 Score
-        f1_scores.append(f1_score(pred, truth))
-        
+        self.f1_scores.extend(f1_column(norm_preds, norm_truths))
         # Faithfulness: Is prediction grounded in context?
-        if norm_pred and norm_pred in norm_context:
-            faith_count += 1
-            
+        self.faith_count += sum(1 for p, c in zip(norm_preds, norm_contexts) if p and p in c)
         # Retrieval Recall: Is ground truth in retrieved context?
-        if norm_truth and norm_truth in norm_context:
-            recall_count += 1
-    # Calculate averages (as percentages)
-    avg_recall = (recall_count / total) * 100
-    avg_em = (sum(em_scores) / total) * 100
-    avg_f1 = (sum(f1_scores) / total) * 100
-    avg_faith = (faith_count / total) * 100
+        self.recall_count += sum(1 for t, c in zip(norm_truths, norm_contexts) if t and t in c)
     
-    # Gap: Grounded Hallucination Rate
-    # Model is faithful to text but doesn't provide correct answer
-    gap = avg_faith - avg_em
+    def result(self):
+        """Return (recall, EM, F1, faithfulness, gap) as percentages."""
+        total = self.total
+        if total == 0:
+            return [0]*5
+        
+        # Calculate averages (as percentages)
+        avg_recall = (self.recall_count / total) * 100
+        avg_em = (self.em_count / total) * 100
+        avg_f1 = (sum(self.f1_scores) / total) * 100
+        avg_faith = (self.faith_count / total) * 100
+        
+        # Gap: Grounded Hallucination Rate
+        # Model is faithful to text but doesn't provide correct answer
+        gap = avg_faith - avg_em
+        
+        return avg_recall, avg_em, avg_f1, avg_faith, gap
+
+
+def calculate_all_metrics(df):
+    """
+    Calculate five core metrics for all rows in DataFrame:
+    1. Retrieval Recall
+    2. Exact Match (EM)
+    3. F1 Score
+    4. Faithfulness
+    5. Gap (Grounded Hallucination Rate)
+    """
+    accumulator = MetricAccumulator()
+    accumulator.add(df)
+    return accumulator.result()
+
+
+class _NeedsFullRead(Exception):
+    """A chunk inferred a non-text dtype, which a full read might not."""
+
+
+def _check_text_dtypes(chunk):
+    """Raise _NeedsFullRead if a column was parsed as numbers or booleans."""
+    for col in chunk.columns:
+        dtype = chunk[col].dtype
+        if dtype != object and not isinstance(dtype, pd.StringDtype) and chunk[col].notna().any():
+            raise _NeedsFullRead(col)
+
+def file_labels(f):
+    """Anonymization label of a result file and whether it holds FAISS results."""
+    # Determine anonymization strategy from filename
+    fname = os.path.basename(f).lower()
+    suffix = " (Filtered)" if "filtered" in fname else ""
+    
+    if "baseline" in fname:
+        anon = f"Baseline{suffix}"
+    elif "placeholder" in fname:
+        anon = f"Placeholder{suffix}"
+    elif "faker" in fname:
+        anon = f"Faker{suffix}"
+    elif "context_aware" in fname:
+        anon = f"Context-Aware{suffix}"
+    else:
+        anon = f"Unknown{suffix}"
+    return anon, ("faiss" in fname or "faiss" in f)
+
+def score_file(chunks, is_faiss, grouped, check_dtypes=True):
+    """
+    Accumulate metrics over the chunks of one file.
     
-    return avg_recall, avg_em, avg_f1, avg_faith, gap
+    Returns:
+        Dictionary mapping retrieval method (None for the whole file) to its MetricAccumulator
+    """
+    accumulators = {}
+    for chunk in chunks:
+        if check_dtypes:
+            _check_text_dtypes(chunk)
+        if is_faiss:
+            accumulators.setdefault(None, MetricAccumulator()).add(chunk)
+        elif grouped:
+            for method, group_df in chunk.groupby('retrieval_method'):
+                accumulators.setdefault(method, MetricAccumulator()).add(group_df)
+    return accumulators
+
+def load_document_texts(folder):
+    """
+    Memory-map the document table of a results folder.
+    
+    Returns:
+        Dictionary mapping corpus name to an Arrow array of texts indexed by doc_id
+    """
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    
+    table = pq.read_table(os.path.join(folder, DOCUMENT_TABLE), memory_map=True)
+    corpora = table.column('corpus').combine_chunks().dictionary_decode()
+    texts = {}
+    for corpus in pc.unique(corpora).to_pylist():
+        rows = table.filter(pc.equal(corpora, corpus))
+        order = pc.sort_indices(rows.column('doc_id'))
+        texts[corpus] = pc.take(rows.column('text'), order).combine_chunks()
+    return texts
+
+def iter_parquet_chunks(f, chunk_size):
+    """
+    Read the metric columns of a Parquet result file in chunks, memory-mapped,
+    with the full text of each retrieved document in 'retrieved_context'.
+    
+    Yields:
+        DataFrame chunks
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    
+    parquet_file = pq.ParquetFile(f, memory_map=True)
+    columns = [col for col in parquet_file.schema_arrow.names if col in PARQUET_COLUMNS]
+    texts = load_document_texts(os.path.dirname(f) or ".")
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        corpora = batch.column('corpus').dictionary_decode()
+        doc_ids = batch.column('doc_id')
+        # Questions without a retrieved document (null doc_id) keep a null context
+        contexts = pa.nulls(batch.num_rows, pa.string())
+        for corpus in pc.unique(corpora).to_pylist():
+            mask = pc.equal(corpora, corpus)
+            ids = pc.if_else(mask, doc_ids, pa.scalar(None, doc_ids.type))
+            contexts = pc.if_else(mask, pc.take(texts[corpus], ids), contexts)
+        chunk = batch.drop_columns(['corpus', 'doc_id']).to_pandas()
+        chunk['retrieved_context'] = contexts.to_pandas()
+        yield chunk
+
+def analyze_file(f, chunk_size=CHUNK_SIZE):
+    """
+    Compute the metric rows of one result file, reading it in chunks.
+    Parquet files are read column-selectively and memory-mapped; CSV files
+    from earlier runs are still supported.
+    
+    Returns:
+        Tuple of (list of result dictionaries, error message or None)
+    """
+    try:
+        anon, is_faiss = file_labels(f)
+        if f.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            header = pq.read_schema(f).names
+            if not any(col in header for col in ANSWER_COLUMNS):
+                return [], None  # Not a results file (e.g. the document table)
+            grouped = 'retrieval_method' in header
+            # Parquet columns are typed, so no dtype check is needed
+            accumulators = score_file(iter_parquet_chunks(f, chunk_size), is_faiss, grouped, check_dtypes=False)
+        else:
+            header = pd.read_csv(f, nrows=0).columns
+            if not any(col in header for col in ANSWER_COLUMNS):
+                return [], None  # Not a results file (e.g. benchmark or timing tables)
+            usecols = [col for col in header if col in METRIC_COLUMNS]
+            grouped = 'retrieval_method' in header
+            
+            try:
+                accumulators = score_file(pd.read_csv(f, usecols=usecols, chunksize=chunk_size), is_faiss, grouped)
+            except _NeedsFullRead:
+                # Keep the dtype pandas infers for the whole column, as a full read does
+                accumulators = score_file([pd.read_csv(f, usecols=usecols)], is_faiss, grouped, check_dtypes=False)
+        
+        results = []
+        for method in sorted(accumulators, key=lambda m: (m is not None, m)):
+            # Determine architecture (retrieval method)
+            if method is None:
+                arch = "Dense (FAISS)"
+            elif "numpy" in method:
+                arch = "Dense (Exact)"
+            elif "bm25" in method:
+                arch = "Sparse (BM25)"
+            else:
+                arch = method
+            
+            recall, em, f1, faith, gap = accumulators[method].result()
+            results.append({
+                "Architecture": arch,
+                "Anonymization": anon,
+                "Retrieval Recall": recall,
+                "Exact Match (EM)": em,
+                "F1 Score": f1,
+                "Faithfulness": faith,
+                "Gap (Hallucination)": gap
+            })
+        return results, None
+    except Exception as e:
+        return [], f"Error ({f}): {e}"
 
 
 def main():
     """Analyze all experiment results and generate summary tables."""
-    files = glob.glob("data/*.csv") + glob.glob("faiss_data/*.csv")
+    parser = argparse.ArgumentParser(description="Compute evaluation metrics for all result files")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: one per file, up to the CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows read per chunk")
+    args = parser.parse_args()
+    
+    files = []
+    for folder in ["data", "faiss_data"]:
+        parquet_files = glob.glob(f"{folder}/*.parquet")
+        # A CSV written next to a Parquet result (config "csv": true) holds the same rows
+        stems = {os.path.splitext(p)[0] for p in parquet_files}
+        files += parquet_files + [c for c in glob.glob(f"{folder}/*.csv") if os.path.splitext(c)[0] not in stems]
     
     results = []
     print(f"--- Analyzing {len(files)} files ---\n")
     
-    for f in files:
-        try:
-            df = pd.read_csv(f)
-            if df.empty:
-                continue
-            
-            # Determine anonymization strategy from filename
-            # Determine anonymization strategy from filename
-            fname = os.path.basename(f).lower()
-            suffix = " (Filtered)" if "filtered" in fname else ""
-            
-            if "baseline" in fname:
-                anon = f"Baseline{suffix}"
-            elif "placeholder" in fname:
-                anon = f"Placeholder{suffix}"
-            elif "faker" in fname:
-                anon = f"Faker{suffix}"
-            elif "context_aware" in fname:
-                anon = f"Context-Aware{suffix}"
-            else:
-                anon = f"Unknown{suffix}"
-            # Determine architecture (retrieval method)
-            
-            # FAISS files
-            if "faiss" in fname or "faiss" in f:
-                recall, em, f1, faith, gap = calculate_all_metrics(df)
-                results.append({
-                    "Architecture": "Dense (FAISS)",
-                    "Anonymization": anon,
-                    "Retrieval Recall": recall,
-                    "Exact Match (EM)": em,
-                    "F1 Score": f1,
-                    "Faithfulness": faith,
-                    "Gap (Hallucination)": gap
-                })
-            
-            # Numpy and BM25 files
-            elif 'retrieval_method' in df.columns:
-                groups = df.groupby('retrieval_method')
-                for method, group_df in groups:
-                    if "numpy" in method:
-                        arch = "Dense (Exact)"
-                    elif "bm25" in method:
-                        arch = "Sparse (BM25)"
-                    else:
-                        arch = method
-                    
-                    recall, em, f1, faith, gap = calculate_all_metrics(group_df)
-                    results.append({
-                        "Architecture": arch,
-                        "Anonymization": anon,
-                        "Retrieval Recall": recall,
-                        "Exact Match (EM)": em,
-                        "F1 Score": f1,
-                        "Faithfulness": faith,
-                        "Gap (Hallucination)": gap
-                    })
-                    
-        except Exception as e:
-            print(f"Error ({f}): {e}")
+    workers = args.workers or min(len(files), os.cpu_count() or 1)
+    if workers <= 1:
+        outputs = [analyze_file(f, args.chunk_size) for f in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(analyze_file, files, [args.chunk_size] * len(files)))
+    
+    for file_results, error in outputs:
+        if error:
+            print(error)
+        results.extend(file_results)
 
     # Format and output results
     df_res = pd.DataFrame(results)
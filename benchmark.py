@@ -0,0 +1,240 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Offline benchmark suite: retrieval scaling and anonymizer throughput on synthetic data.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RETRIEVERS = ["dense_numpy", "dense_faiss", "sparse_bm25"]
+STRATEGIES = ["placeholder", "semantic", "context_aware"]
+# (embedder, generator, analyzer, fill-mask) per mode
+MODEL_SETS = {
+    "stub": ("stub", "stub", "stub", "stub"),
+    "real": ("all-MiniLM-L6-v2", "google/flan-t5-base", "presidio", "distilbert-base-uncased"),
+}
+# Metrics shown by --compare; True means higher is better
+COMPARED_METRICS = {
+    "ingest_s": False, "qps": True, "p99_ms": False, "peak_mem_mb": False,
+    "docs_per_s": True,
+}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_retrieval_case(retriever, n_docs, n_queries, k, batch_size, latency_queries, model_set, seed):
+    """
+    Ingest a synthetic corpus and measure query throughput and latency (runs in a fresh process).
+
+    Returns:
+        Result row dictionary
+    """
+    from src.rag_pipeline import RAGSystem
+    from src.stubs import synthetic_squad
+
+    embedder_name, generator_name, _, _ = MODEL_SETS[model_set]
+    samples = synthetic_squad(n_docs, seed=seed)
+    documents = [s['context'] for s in samples]
+    questions = [samples[i % n_docs]['question'] for i in range(n_queries)]
+    sources = np.arange(n_queries) % n_docs
+
+    with RAGSystem(retrieval_method=retriever, model_name=generator_name, embedder_name=embedder_name) as rag:
+        base_mem = peak_rss_mb()
+
+        start = time.perf_counter()
+        rag.ingest_documents(documents)
+        ingest_s = time.perf_counter() - start
+        del samples, documents
+
+        # Throughput: batched retrieval, query encoding included
+        hits = 0
+        start = time.perf_counter()
+        for b in range(0, n_queries, batch_size):
+            _, indices = rag.search_batch(questions[b:b + batch_size], k)
+            hits += int((indices == sources[b:b + batch_size, None]).any(axis=1).sum())
+        search_s = time.perf_counter() - start
+
+        # Latency: one query per call
+        latencies = []
+        for q in questions[:latency_queries]:
+            start = time.perf_counter()
+            rag.search_batch([q], k)
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+
+    peak = peak_rss_mb()
+    return {
+        "suite": "retrieval",
+        "case": retriever,
+        "n_docs": n_docs,
+        "ingest_s": round(ingest_s, 4),
+        "qps": round(n_queries / search_s, 2),
+        "p50_ms": round(float(p50), 4),
+        "p99_ms": round(float(p99), 4),
+        f"hit@{k}": round(hits / n_queries, 4),
+        "peak_mem_mb": None if peak is None else round(peak - base_mem, 1),
+    }
+
+
+def run_anonymizer_case(n_docs, model_set, seed):
+    """
+    Measure PII analysis and per-strategy substitution throughput (runs in a fresh process).
+
+    Returns:
+        List of result rows, one per stage
+    """
+    from src.anonymizer import Anonymizer
+    from src.stubs import synthetic_squad
+    from src import instrumentation
+
+    _, _, analyzer_name, fill_mask_name = MODEL_SETS[model_set]
+    texts = [s['context'] for s in synthetic_squad(n_docs, seed=seed)]
+    anonymizer = Anonymizer(seed=42, analyzer_name=analyzer_name, fill_mask_model=fill_mask_name)
+    base_mem = peak_rss_mb()
+
+    instrumentation.enable()
+    with instrumentation.scope("benchmark"):
+        anonymizer.anonymize_all(texts, strategies=STRATEGIES)
+    peak = peak_rss_mb()
+
+    stages = {row["stage"]: row for row in instrumentation.summary(["benchmark"])}
+    rows = []
+    for case in ["analyze"] + STRATEGIES:
+        stage = stages.get(f"anonymizer.{case}")
+        if stage is None:
+            continue
+        rows.append({
+            "suite": "anonymizer",
+            "case": case,
+            "n_docs": n_docs,
+            "docs_per_s": stage["items_per_s"],
+            "total_s": stage["total_s"],
+            "peak_mem_mb": None if peak is None else round(peak - base_mem, 1),
+        })
+    return rows
+
+
+def run_isolated(fn, *args):
+    """Run fn in a new process so peak memory is measured for this case alone."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+def run_metadata(model_set):
+    """Commit and machine details stored with every result file."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "models": model_set,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(rows, baseline_path):
+    """Print the change of each metric against an earlier result file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["suite"], r["case"], r["n_docs"]): r for r in baseline["results"]}
+
+    print(f"\n=== Comparison with {baseline_path} (commit {baseline['meta']['commit']}) ===")
+    lines = []
+    for row in rows:
+        previous = old.get((row["suite"], row["case"], row["n_docs"]))
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            new_value, old_value = row.get(metric), previous.get(metric)
+            if not new_value or not old_value:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            better = change > 0 if higher_is_better else change < 0
+            lines.append({
+                "suite": row["suite"], "case": row["case"], "n_docs": row["n_docs"], "metric": metric,
+                "before": old_value, "after": new_value, "change_%": round(change, 1),
+                "verdict": "better" if better else "worse",
+            })
+    if lines:
+        print(pd.DataFrame(lines).to_string(index=False))
+    else:
+        print("   No matching cases.")
+
+
+def main():
+    """Run the benchmark suite and save the results."""
+    parser = argparse.ArgumentParser(description="Offline retrieval and anonymization benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Corpus sizes (documents) for the retrieval benchmark")
+    parser.add_argument("--retrievers", nargs="+", default=RETRIEVERS, choices=RETRIEVERS)
+    parser.add_argument("--queries", type=int, default=1000, help="Queries for the throughput measurement")
+    parser.add_argument("--latency-queries", type=int, default=200, help="Single-query calls for p50/p99")
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per search_batch call")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--anon-docs", type=int, default=2000, help="Documents for the anonymizer benchmark (0 skips it)")
+    parser.add_argument("--real-models", action="store_true",
+                        help="Use the real embedder/analyzer/fill-mask models instead of the offline stubs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmarks", help="Folder for the result files")
+    parser.add_argument("--compare", help="Earlier result JSON to compare against")
+    args = parser.parse_args()
+
+    model_set = "real" if args.real_models else "stub"
+    rows = []
+
+    for n_docs in args.sizes:
+        for retriever in args.retrievers:
+            print(f"\n>>> Retrieval benchmark: {retriever}, {n_docs} docs ({model_set} models)")
+            row = run_isolated(run_retrieval_case, retriever, n_docs, args.queries, args.k,
+                               args.batch_size, args.latency_queries, model_set, args.seed)
+            print(f"   ingest {row['ingest_s']:.2f}s | {row['qps']:.1f} q/s | p99 {row['p99_ms']:.2f} ms")
+            rows.append(row)
+
+    if args.anon_docs > 0:
+        print(f"\n>>> Anonymizer benchmark: {args.anon_docs} docs ({model_set} models)")
+        rows.extend(run_isolated(run_anonymizer_case, args.anon_docs, model_set, args.seed))
+
+    df = pd.DataFrame(rows)
+    print("\n=== BENCHMARK RESULTS ===")
+    print(df.to_string(index=False, float_format="%.3f"))
+
+    meta = run_metadata(model_set)
+    os.makedirs(args.output, exist_ok=True)
+    stem = os.path.join(args.output, f"bench_{meta['timestamp'].replace(':', '')}_{meta['commit']}")
+    with open(f"{stem}.json", "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": rows}, f, indent=2)
+    df.assign(commit=meta["commit"], models=model_set).to_csv(f"{stem}.csv", index=False)
+    print(f"   [SAVED] Benchmark results saved to: {stem}.json (+ .csv)")
+
+    if args.compare:
+        compare(rows, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -1,120 +1,111 @@
-import csv
-import os
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Keeps only PII-rich questions in every result file: questions whose source
+paragraph had entities detected by the anonymizer (see the entity table).
+"""
 
-# Configuration
+import argparse
+import glob
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 # Configuration
 TARGET_ROWS = 250
+RESULT_FOLDERS = ['data', 'faiss_data']
+ENTITY_TABLE = 'entities.parquet'
+BATCH_SIZE = 65536
+
+
+def result_files(folder):
+    """Unfiltered Parquet result files of a folder (tables without question ids are skipped)."""
+    files = []
+    for path in sorted(glob.glob(os.path.join(folder, '*.parquet'))):
+        if '_filtered' in os.path.basename(path):
+            continue
+        if 'question_id' in pq.read_schema(path).names:
+            files.append(path)
+    return files
+
+def pii_documents(folder):
+    """Boolean array indexed by doc_id: did the anonymizer find an entity in the document?"""
+    table = pq.read_table(os.path.join(folder, ENTITY_TABLE), columns=['doc_id', 'entity_count'], memory_map=True)
+    has_pii = np.zeros(len(table), dtype=bool)
+    doc_ids = table.column('doc_id').to_numpy()
+    has_pii[doc_ids] = table.column('entity_count').to_numpy() > 0
+    return has_pii
 
-# Define file groups. 'baseline' and 'placeholder' are used to detect PII rows.
-# 'others' are additional files to filter using the same indices.
-# Define file groups. 'baseline' and 'placeholder' are used to detect PII rows.
-# 'others' are additional files to filter using the same indices.
-DATA_GROUPS = [
-    {
-        'baseline': 'data/results_01_baseline.csv',
-        'placeholder': 'data/results_02_placeholder.csv',
-        'others': [
-            'data/results_03_faker.csv',
-            'data/results_04_context_aware.csv'
-        ]
-    },
-    {
-        'baseline': 'faiss_data/results_baseline_faiss.csv',
-        'placeholder': 'faiss_data/results_placeholder_faiss.csv',
-        'others': [
-            'faiss_data/results_faker_faiss.csv',
-            'faiss_data/results_context_aware_faiss.csv'
-        ]
-    }
-]
+def select_questions(path, has_pii, target_rows):
+    """
+    Ids of the first target_rows questions whose source document contains PII.
+    Only the question_id and source_doc_id columns are read, and reading stops
+    as soon as enough questions are found.
+    """
+    selected = {}
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=BATCH_SIZE, columns=['question_id', 'source_doc_id']):
+        question_ids = batch.column('question_id').to_numpy()
+        sources = batch.column('source_doc_id').to_numpy()
+        for question_id in question_ids[has_pii[sources]]:
+            selected[int(question_id)] = True
+            if len(selected) >= target_rows:
+                return sorted(selected)
+    return sorted(selected)
 
-def load_csv(path):
-    rows = []
-    if not os.path.exists(path):
-        print(f"Warning: File not found: {path}")
-        return [], []
-        
-    with open(path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rows.append(row)
-    return rows, reader.fieldnames
+def filter_file(path, selected):
+    """
+    Write <name>_filtered.parquet with the rows of the selected questions.
+    Rows are matched by question_id and streamed batch by batch.
 
-def write_csv(path, fieldnames, rows):
-    # Determine output path (append _filtered before extension)
+    Returns:
+        Number of rows written
+    """
     base, ext = os.path.splitext(path)
-    if "_filtered" in base:
-        output_path = path # Already filtered name?
-    else:
-        output_path = f"{base}_filtered{ext}"
-        
-    with open(output_path, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
-    print(f"  Saved: {os.path.basename(output_path)}")
+    output_path = f"{base}_filtered{ext}"
+    value_set = pa.array(selected, pa.int32())
 
-def process_group(group_config):
-    print(f"Processing group based on: {os.path.basename(group_config['baseline'])}")
-    
-    # Load primary files for detection
-    base_rows, base_fields = load_csv(group_config['baseline'])
-    place_rows, place_fields = load_csv(group_config['placeholder'])
-    
-    if len(base_rows) != len(place_rows):
-        print("Error: Row count mismatch between Baseline and Placeholder!")
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    written = 0
+    with pq.ParquetWriter(f"{output_path}.tmp", parquet_file.schema_arrow) as writer:
+        for batch in parquet_file.iter_batches(batch_size=BATCH_SIZE):
+            kept = batch.filter(pc.is_in(batch.column('question_id'), value_set=value_set))
+            if kept.num_rows:
+                writer.write_batch(kept)
+                written += kept.num_rows
+    os.replace(f"{output_path}.tmp", output_path)
+    print(f"  Saved: {os.path.basename(output_path)} ({written} rows)")
+    return written
+
+def process_folder(folder, target_rows):
+    files = result_files(folder)
+    if not files:
+        print(f"Warning: No Parquet result files in {folder}/")
+        return
+    if not os.path.exists(os.path.join(folder, ENTITY_TABLE)):
+        print(f"Warning: {folder}/{ENTITY_TABLE} not found (it is written by runs that anonymize)")
         return
+    print(f"Processing folder: {folder}/")
+
+    # Every result file holds the same questions, so any of them gives the question -> document key
+    selected = select_questions(files[0], pii_documents(folder), target_rows)
+    print(f"  Found {len(selected)} PII questions.")
 
-    # Load other files
-    other_files_data = []
-    for path in group_config['others']:
-        rows, fields = load_csv(path)
-        other_files_data.append({
-            'path': path,
-            'rows': rows,
-            'fields': fields
-        })
-        if len(rows) != len(base_rows):
-             print(f"Warning: Row count mismatch for {os.path.basename(path)}")
-    
-    # Identify indices
-    pii_indices = []
-    for i in range(len(base_rows)):
-        b_row = base_rows[i]
-        p_row = place_rows[i]
-        
-        # Check if context snippet changed
-        if b_row.get('retrieved_context_snippet') != p_row.get('retrieved_context_snippet'):
-            pii_indices.append(i)
-            
-        if len(pii_indices) >= TARGET_ROWS:
-            break
-            
-    print(f"  Found {len(pii_indices)} PII rows.")
-    
-    # Filter and Save Baseline & Placeholder
-    filtered_base = [base_rows[i] for i in pii_indices]
-    filtered_place = [place_rows[i] for i in pii_indices]
-    
-    write_csv(group_config['baseline'], base_fields, filtered_base)
-    write_csv(group_config['placeholder'], place_fields, filtered_place)
-    
-    # Filter and Save Others
-    for item in other_files_data:
-        # Only if we have data suitable for these indices
-        if len(item['rows']) >= max(pii_indices):
-            filtered_rows = [item['rows'][i] for i in pii_indices]
-            write_csv(item['path'], item['fields'], filtered_rows)
-        else:
-            print(f"  Skipping {os.path.basename(item['path'])} due to size mismatch.")
+    for path in files:
+        filter_file(path, selected)
     print("")
 
 def main():
-    for group in DATA_GROUPS:
-        process_group(group)
+    parser = argparse.ArgumentParser(description="Filter result files down to PII-rich questions")
+    parser.add_argument("--target-rows", type=int, default=TARGET_ROWS, help="Questions kept per folder")
+    parser.add_argument("--folders", nargs="+", default=RESULT_FOLDERS)
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        process_folder(folder, args.target_rows)
     print("Done.")
 
 if __name__ == "__main__":
     main()
-
@@ -4,100 +4,80 @@ Student ID: 280201055
 FAISS-specific experiment runner.
 """
 
+import argparse
 import pandas as pd
+import numpy as np
 import os
-import time
-from src.utils import load_squad_sample
-from src.anonymizer import Anonymizer
-from src.rag_pipeline import RAGSystem
+from src.utils import load_squad_sample, build_document_table
+from src.rag_pipeline import benchmark_faiss_indexes
+from src.embedding_store import EmbeddingStore
+from src.experiment import EMBEDDER_NAME, EMBEDDING_STORE_DIR, load_config, run_grid
+from src import models
 
+CONFIG_PATH = "configs/faiss.json"
 
-def save_faiss_results(results, filename):
-    """Save FAISS experiment results to CSV."""
-    folder_path = os.path.join(os.getcwd(), "faiss_data")
-    os.makedirs(folder_path, exist_ok=True)
-    full_path = os.path.join(folder_path, filename)
-    
-    if not results:
-        print(f"   [WARNING] No results to save: {filename}")
-        return
-
-    df = pd.DataFrame(results)
-    df.to_csv(full_path, index=False)
-    print(f"   [SAVED] FAISS results saved to: {full_path}")
 
-def run_experiment_batch(documents, questions, answers, anon_strategy, retrieval_method):
-    """Run a batch of FAISS experiments."""
-    print(f"\n>>> Running FAISS Experiment: Anonymization='{anon_strategy}'")
+def default_operating_points(num_docs):
+    """FAISS configurations swept by the benchmark: exact, IVF-Flat, HNSW and IVF-PQ."""
+    nlist = max(1, min(int(4 * np.sqrt(num_docs)), num_docs // 39))
+    pq_bits = 8 if num_docs >= 256 * 39 else 4  # PQ training needs ~39 points per centroid
     
-    rag = RAGSystem(retrieval_method=retrieval_method)
-    rag.ingest_documents(documents)
+    points = [{"index_spec": "Flat", "metric": "ip"}]
+    for nprobe in (1, 4, 16, 64):
+        if nprobe <= nlist:
+            points.append({"index_spec": f"IVF{nlist},Flat", "metric": "ip", "nprobe": nprobe})
+    for ef_search in (16, 64, 256):
+        points.append({"index_spec": "HNSW32", "metric": "ip", "ef_search": ef_search})
+    for nprobe in (1, 4, 16, 64):
+        if nprobe <= nlist:
+            points.append({"index_spec": f"IVF{nlist},PQ16x{pq_bits}", "metric": "ip", "nprobe": nprobe})
+    return points
+
+def run_index_benchmark(documents, questions, k=10):
+    """Report recall@k vs. latency and memory for several FAISS index types."""
+    print(f"\n=== FAISS INDEX BENCHMARK ({len(documents)} docs, {len(questions)} queries) ===")
+    embedder = models.get_embedder(EMBEDDER_NAME)
+    store = EmbeddingStore(EMBEDDING_STORE_DIR, EMBEDDER_NAME)
+    doc_embeddings = store.get_embeddings(documents, embedder.encode)
+    query_embeddings = embedder.encode(questions)
     
-    results = []
-    start_time = time.time()
+    results = benchmark_faiss_indexes(doc_embeddings, query_embeddings, default_operating_points(len(documents)), k=k)
+    df = pd.DataFrame(results)
+    print(df.to_string(index=False, float_format="%.3f"))
     
-    for i, (q, truth) in enumerate(zip(questions, answers)):
-        retrieved_docs = rag.retrieve(q, k=1)
-        context = retrieved_docs[0] if retrieved_docs else ""
-        model_pred = rag.generate_answer(q, context)
-        
-        results.append({
-            "anonymization_strategy": anon_strategy,
-            "retrieval_method": retrieval_method,
-            "question": q,
-            "ground_truth": truth,
-            "retrieved_context_snippet": context[:200], 
-            "generated_answer": model_pred
-        })
-        
-        if (i+1) % 50 == 0:
-            print(f"   Processed {i+1}/{len(questions)} queries...")
-
-    duration = time.time() - start_time
-    print(f"   Finished in {duration:.2f} seconds.")
-    return results
+    folder_path = os.path.join(os.getcwd(), "faiss_data")
+    os.makedirs(folder_path, exist_ok=True)
+    full_path = os.path.join(folder_path, "index_benchmark.csv")
+    df.to_csv(full_path, index=False)
+    print(f"   [SAVED] Index benchmark saved to: {full_path}")
 
 def main():
     """Main FAISS experiment pipeline."""
-    NUM_SAMPLES = 500
-    
-    print("--- Loading Data ---")
-    raw_data = load_squad_sample(n=NUM_SAMPLES)
-    
-    original_docs = [d['context'] for d in raw_data]
-    questions = [d['question'] for d in raw_data]
-    ground_truths = [d['answers'] for d in raw_data]
+    parser = argparse.ArgumentParser(description="FAISS experiment runner")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Benchmark FAISS index types (recall@k vs. latency/memory) instead of running experiments")
+    parser.add_argument("--k", type=int, default=10, help="Cut-off for recall@k in benchmark mode")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip query chunks already saved as finished chunk files")
+    parser.add_argument("--workers", default="auto",
+                        help="Query worker processes ('auto' sizes the pool by CPU count)")
+    parser.add_argument("--instrument", action="store_true",
+                        help="Record per-stage latency/throughput and save timings.json/.csv next to the results")
+    args = parser.parse_args()
     
-    anonymizer = Anonymizer()
+    if args.benchmark:
+        config = load_config(CONFIG_PATH)
+        print("--- Loading Data ---")
+        raw_data = load_squad_sample(n=config["num_samples"])
+        documents, _ = build_document_table(raw_data)
+        run_index_benchmark(documents, [d['question'] for d in raw_data], k=args.k)
+        return
     
-    # Baseline FAISS
-    print("\n=== FAISS 1: BASELINE ===")
-    res_base = run_experiment_batch(original_docs, questions, ground_truths, "Baseline", "dense_faiss")
-    save_faiss_results(res_base, "results_baseline_faiss.csv")
-
-    # Placeholder FAISS
-    print("\n=== FAISS 2: PLACEHOLDER ===")
-    print("Generating Placeholder data...")
-    docs_place = [anonymizer.anonymize(d, strategy="placeholder") for d in original_docs]
-    res_place = run_experiment_batch(docs_place, questions, ground_truths, "Placeholder", "dense_faiss")
-    save_faiss_results(res_place, "results_placeholder_faiss.csv")
-
-    # Faker FAISS
-    print("\n=== FAISS 3: FAKER ===")
-    print("Generating Faker data...")
-    docs_faker = [anonymizer.anonymize(d, strategy="semantic") for d in original_docs]
-    res_faker = run_experiment_batch(docs_faker, questions, ground_truths, "Faker", "dense_faiss")
-    save_faiss_results(res_faker, "results_faker_faiss.csv")
-
-    # Context Aware FAISS
-    print("\n=== FAISS 4: CONTEXT AWARE ===")
-    print("Generating Context Aware data (This may take time)...")
-    docs_context = [anonymizer.anonymize(d, strategy="context_aware") for d in original_docs]
-    res_context = run_experiment_batch(docs_context, questions, ground_truths, "ContextAware", "dense_faiss")
-    save_faiss_results(res_context, "results_context_aware_faiss.csv")
+    run_grid([load_config(CONFIG_PATH)], resume=args.resume, workers=args.workers,
+             instrument=args.instrument)
 
     print("\nAll FAISS experiments completed! Check the 'faiss_data/' folder.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,33 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Runs one or more experiment configs as a single grid, sharing data loading,
+anonymization and embeddings between them.
+"""
+
+import argparse
+from src.experiment import load_config, run_grid
+
+
+def main():
+    """Run the experiment grid described by the given configs."""
+    parser = argparse.ArgumentParser(description="Experiment grid runner")
+    parser.add_argument("--config", nargs="+", default=["configs/main.json", "configs/faiss.json"],
+                        help="Grid config files (JSON)")
+    parser.add_argument("--workers", default="auto",
+                        help="Query worker processes ('auto' sizes the pool by CPU count)")
+    parser.add_argument("--instrument", action="store_true",
+                        help="Record per-stage latency/throughput and save timings.json/.csv next to the results")
+    parser.add_argument("--threads-per-worker", type=int, default=4,
+                        help="Intra-op threads (torch, BLAS, OpenMP) used by each worker process")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip query chunks already saved as finished chunk files")
+    args = parser.parse_args()
+
+    run_grid([load_config(path) for path in args.config], resume=args.resume,
+             workers=args.workers, threads_per_worker=args.threads_per_worker,
+             instrument=args.instrument)
+    print("\nAll experiments completed!")
+
+if __name__ == "__main__":
+    main()
@@ -4,31 +4,214 @@ Student ID: 280201055
 Anonymization module for PII detection and substitution.
 """
 
-from presidio_analyzer import AnalyzerEngine
-from faker import Faker
-from transformers import pipeline
+from collections import namedtuple
+import bisect
+import os
 import random
+from src.cache import AnonymizationCache, text_hash
+from src import models
+from src import instrumentation
+
+
+# Maps an entity span in the original text to its replacement span in the anonymized text
+SpanMapping = namedtuple("SpanMapping", ["orig_start", "orig_end", "new_start", "new_end", "entity_type"])
+# A detected entity, as stored in the cache and in the entity table
+EntitySpan = namedtuple("EntitySpan", ["entity_type", "start", "end", "score"])
+
+
+def write_entity_table(path, entities):
+    """
+    Write the entities detected in a corpus as a Parquet side table.
+    There is one row per document (doc_id is the position in the corpus)
+    with its entity count and its spans in text order.
+    
+    Args:
+        path: Parquet file to write
+        entities: List of EntitySpan lists, one per document (from anonymize_all)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    span_type = pa.struct([
+        ("entity_type", pa.string()),
+        ("start", pa.int32()),
+        ("end", pa.int32()),
+        ("score", pa.float32()),
+    ])
+    schema = pa.schema([
+        ("doc_id", pa.int32()),
+        ("entity_count", pa.int32()),
+        ("spans", pa.list_(span_type)),
+    ])
+    table = pa.Table.from_arrays([
+        pa.array(range(len(entities)), pa.int32()),
+        pa.array([len(spans) for spans in entities], pa.int32()),
+        pa.array([[span._asdict() for span in sorted(spans, key=lambda e: e.start)] for spans in entities],
+                 pa.list_(span_type)),
+    ], schema=schema)
+    
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    pq.write_table(table, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def rewrite_spans(text, replacements):
+    """
+    Build the rewritten text in a single pass.
+    
+    Args:
+        text: Original text
+        replacements: List of (start, end, replacement, entity_type) tuples,
+            sorted by start and non-overlapping
+    
+    Returns:
+        Tuple of (rewritten text, list of SpanMapping)
+    """
+    pieces = []
+    offset_map = []
+    cursor = 0
+    new_pos = 0
+    
+    for start, end, replacement, entity_type in replacements:
+        pieces.append(text[cursor:start])
+        new_pos += start - cursor
+        pieces.append(replacement)
+        offset_map.append(SpanMapping(start, end, new_pos, new_pos + len(replacement), entity_type))
+        new_pos += len(replacement)
+        cursor = end
+        
+    pieces.append(text[cursor:])
+    return "".join(pieces), offset_map
+
+
+def map_span_to_original(offset_map, start, end):
+    """
+    Map a [start, end) span of anonymized text back to original text coordinates.
+    Positions inside a replacement snap to the boundaries of the original entity.
+    """
+    new_starts = [m.new_start for m in offset_map]
+    
+    def to_original(pos, is_end):
+        # An end position belongs to the span that starts strictly before it
+        if is_end:
+            i = bisect.bisect_left(new_starts, pos) - 1
+        else:
+            i = bisect.bisect_right(new_starts, pos) - 1
+        if i < 0:
+            return pos
+        m = offset_map[i]
+        if is_end and pos <= m.new_end:
+            return m.orig_end
+        if not is_end and pos < max(m.new_end, m.new_start + 1):
+            return m.orig_start
+        return m.orig_end + (pos - m.new_end)
+    
+    return to_original(start, False), to_original(end, True)
 
 
 class Anonymizer:
     """Handles PII detection and anonymization using multiple strategies."""
     
-    def __init__(self):
-        print("Initializing Anonymizer Engine...")
-        self.analyzer = AnalyzerEngine()
-        self.faker = Faker()
+    def __init__(self, seed=None, cache_dir=None, cache_max_bytes=512 * 1024 * 1024,
+                 analyzer_name="presidio", fill_mask_model="distilbert-base-uncased"):
+        """
+        Initialize the anonymizer.
         
-        print("Loading DistilBERT for Context-Aware substitution...")
-        self.fill_mask = pipeline("fill-mask", model="distilbert-base-uncased", device=-1)
+        Args:
+            seed: Faker seed. When set, Faker is reseeded per document so
+                'semantic' output depends only on the document and can be cached
+            cache_dir: Directory for the persistent output cache (None disables it)
+            cache_max_bytes: Size limit of the cache before old entries are evicted
+            analyzer_name: 'presidio', or 'stub' for the offline regex analyzer
+            fill_mask_model: Model for 'context_aware' ('stub' for the offline stand-in)
+        """
+        print("Initializing Anonymizer Engine...")
+        # Models are loaded on first use (or in warmup): DistilBERT only for 'context_aware'
+        self.analyzer_name = analyzer_name
+        self.fill_mask_model = fill_mask_model
+        self.seed = seed
+        self._faker = None
         
         self.target_entities = ["PERSON", "GPE", "ORG"] 
+        self.score_threshold = 0.4
+        
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = AnonymizationCache(cache_dir, max_bytes=cache_max_bytes)
+
+    @property
+    def analyzer(self):
+        return models.get_analyzer(self.analyzer_name)
+
+    @property
+    def batch_analyzer(self):
+        return models.get_batch_analyzer(self.analyzer_name)
+
+    @property
+    def fill_mask(self):
+        return models.get_fill_mask(self.fill_mask_model)
+
+    @property
+    def faker(self):
+        if self._faker is None:
+            from faker import Faker
+            self._faker = Faker()
+        return self._faker
+
+    def warmup(self, strategies=("placeholder", "semantic", "context_aware")):
+        """Load the models needed by the given strategies now instead of on first use."""
+        self.batch_analyzer
+        if "semantic" in strategies:
+            self.faker
+        if "context_aware" in strategies:
+            self.fill_mask
+        return self
+
+    def config_fingerprint(self):
+        """
+        Settings that change the anonymized output; part of every cache key.
+        Built from configuration only, so a fully cached run never loads the analyzer.
+        """
+        return {
+            "analyzer": self.analyzer_name,
+            "target_entities": sorted(self.target_entities),
+            "score_threshold": self.score_threshold,
+            "language": "en",
+            "nlp_configuration": str(models.analyzer_nlp_configuration(self.analyzer_name)),
+            "fill_mask_model": self.fill_mask_model,
+        }
 
     def analyze(self, text):
         """Detect PII entities in text."""
-        results = self.analyzer.analyze(text=text, language='en')
+        with instrumentation.timed("anonymizer.analyze"):
+            results = self.analyzer.analyze(text=text, language='en')
+        return self._filter_entities(results)
+
+    def analyze_batch(self, texts, batch_size=32, n_process=1):
+        """
+        Detect PII entities for many texts at once.
+        spaCy processes the texts with nlp.pipe instead of one call per document.
+        
+        Args:
+            texts: List of input texts
+            batch_size: Number of texts per spaCy batch
+            n_process: Number of spaCy worker processes
+        
+        Returns:
+            List of entity lists, one per input text (same as calling analyze on each)
+        """
+        texts = list(texts)
+        with instrumentation.timed("anonymizer.analyze", len(texts)):
+            batch_results = self.batch_analyzer.analyze_iterator(
+                texts, language='en', batch_size=batch_size, n_process=n_process
+            )
+            return [self._filter_entities(results) for results in batch_results]
+
+    def _filter_entities(self, results):
+        """Keep only target entity types above the score threshold."""
         filtered_results = [
             res for res in results 
-            if res.entity_type in self.target_entities and res.score > 0.4
+            if res.entity_type in self.target_entities and res.score > self.score_threshold
         ]
         return filtered_results
 
@@ -52,6 +235,48 @@ class Anonymizer:
         except Exception:
             return "[MASKED_ENTITY]"
 
+        return self._pick_bert_candidate(predictions, original_word)
+
+    def get_bert_replacements(self, requests, batch_size=16):
+        """
+        Batched version of get_bert_replacement.
+        Masked variants are sorted by length and sent to DistilBERT in padded
+        batches; if a batch fails, its items are retried one by one so the
+        result is the same as calling get_bert_replacement for each request.
+        
+        Args:
+            requests: List of (text, start, end, original_word) tuples
+            batch_size: Number of masked texts per forward pass
+        
+        Returns:
+            List of replacements in request order
+        """
+        masked_texts = [text[:start] + "[MASK]" + text[end:] for text, start, end, _ in requests]
+        order = sorted(range(len(requests)), key=lambda i: len(masked_texts[i]))
+        replacements = [None] * len(requests)
+        
+        for batch_start in range(0, len(order), batch_size):
+            batch_ids = order[batch_start:batch_start + batch_size]
+            try:
+                with instrumentation.timed("anonymizer.fill_mask", len(batch_ids)):
+                    batch_predictions = self.fill_mask(
+                        [masked_texts[i] for i in batch_ids], top_k=5, batch_size=batch_size
+                    )
+                # The pipeline unwraps single-item lists
+                if len(batch_ids) == 1:
+                    batch_predictions = [batch_predictions]
+            except Exception:
+                for i in batch_ids:
+                    replacements[i] = self.get_bert_replacement(*requests[i])
+                continue
+                
+            for i, predictions in zip(batch_ids, batch_predictions):
+                replacements[i] = self._pick_bert_candidate(predictions, requests[i][3])
+        
+        return replacements
+
+    def _pick_bert_candidate(self, predictions, original_word):
+        """Return the first prediction that is not a variant of the original word."""
         best_candidate = "[MASKED_ENTITY]"
         for pred in predictions:
             candidate = pred['token_str'].strip()
@@ -66,39 +291,209 @@ class Anonymizer:
         
         return best_candidate
 
-    def anonymize(self, text, strategy="placeholder"):
+    def anonymize(self, text, strategy="placeholder", return_offsets=False):
         """
         Anonymize text using specified strategy.
         
         Args:
             text: Input text to anonymize
             strategy: 'placeholder', 'semantic', or 'context_aware'
+            return_offsets: Also return the SpanMapping list (see map_span_to_original)
         
         Returns:
-            Anonymized text
+            Anonymized text, or (anonymized text, offset map) if return_offsets is True
         """
         entities = self.analyze(text)
+        with instrumentation.timed(f"anonymizer.{strategy}"):
+            anonymized_text, offset_map = self._substitute(text, entities, strategy)
+        if return_offsets:
+            return anonymized_text, offset_map
+        return anonymized_text
+
+    def anonymize_batch(self, texts, strategy="placeholder", batch_size=32, n_process=1, return_offsets=False):
+        """
+        Anonymize a list of texts, running PII detection in batches.
+        
+        Args:
+            texts: List of input texts
+            strategy: 'placeholder', 'semantic', or 'context_aware'
+            batch_size: Number of texts per spaCy batch
+            n_process: Number of spaCy worker processes
+            return_offsets: Return (anonymized text, offset map) pairs instead of texts
+        
+        Returns:
+            List of anonymized texts in input order
+        """
+        return self.anonymize_all(
+            texts, strategies=[strategy], batch_size=batch_size,
+            n_process=n_process, return_offsets=return_offsets
+        )[strategy]
+
+    def anonymize_all(self, texts, strategies=("placeholder", "semantic", "context_aware"),
+                      batch_size=32, n_process=1, return_offsets=False, return_entities=False):
+        """
+        Detect entities once and produce the output of every requested strategy.
+        
+        Args:
+            texts: List of input texts
+            strategies: Strategies to apply to the same detected spans
+            batch_size: Number of texts per spaCy batch
+            n_process: Number of spaCy worker processes
+            return_offsets: Return (anonymized text, offset map) pairs instead of texts
+            return_entities: Also return the EntitySpan list of every text
+                (see write_entity_table); cached documents are not re-analyzed
+        
+        Returns:
+            Dictionary mapping each strategy to its list of anonymized texts,
+            or (dictionary, entity lists) if return_entities is True
+        """
+        texts = list(texts)
+        
+        # Repeated documents are anonymized once and share the result
+        unique_texts = list(dict.fromkeys(texts))
+        if len(unique_texts) < len(texts):
+            unique_outputs, unique_entities = self.anonymize_all(
+                unique_texts, strategies=strategies, batch_size=batch_size,
+                n_process=n_process, return_offsets=return_offsets, return_entities=True
+            )
+            position = {text: i for i, text in enumerate(unique_texts)}
+            outputs = {
+                strategy: [unique_outputs[strategy][position[text]] for text in texts]
+                for strategy in strategies
+            }
+            if return_entities:
+                return outputs, [unique_entities[position[text]] for text in texts]
+            return outputs
+        
+        outputs = {strategy: [None] * len(texts) for strategy in strategies}
+        entities = [None] * len(texts)
+        
+        cache_keys = {}
+        if self.cache is not None:
+            fingerprint = self.config_fingerprint()
+            for strategy in strategies:
+                if strategy == "semantic" and self.seed is None:
+                    continue  # Unseeded Faker output is random, nothing to reuse
+                for i, text in enumerate(texts):
+                    key = self.cache.make_key(text_hash(text), strategy, fingerprint, self.seed)
+                    cache_keys[(strategy, i)] = key
+                    entry = self.cache.get(key)
+                    # Entries written before entities were stored are computed again once
+                    if entry is not None and "entities" in entry:
+                        offset_map = [SpanMapping(*m) for m in entry["offsets"]]
+                        outputs[strategy][i] = (entry["text"], offset_map)
+                        entities[i] = [EntitySpan(*e) for e in entry["entities"]]
+        
+        # Only documents with a missing strategy output (or missing entities,
+        # when they are requested) go through detection
+        pending = [
+            i for i in range(len(texts))
+            if any(outputs[s][i] is None for s in strategies) or (return_entities and entities[i] is None)
+        ]
+        if self.cache is not None:
+            print(f"   Anonymization cache: {len(texts) - len(pending)}/{len(texts)} documents fully cached.")
+        
+        pending_texts = [texts[i] for i in pending]
+        all_entities = []
+        if pending_texts:
+            all_entities = self.analyze_batch(pending_texts, batch_size=batch_size, n_process=n_process)
+        for i, detected in zip(pending, all_entities):
+            entities[i] = [EntitySpan(e.entity_type, e.start, e.end, float(e.score)) for e in detected]
+        
+        for strategy in strategies:
+            missing = [j for j, i in enumerate(pending) if outputs[strategy][i] is None]
+            if missing:
+                with instrumentation.timed(f"anonymizer.{strategy}", len(missing)):
+                    self._substitute_missing(strategy, texts, pending, missing, all_entities, outputs, cache_keys)
+        
+        if not return_offsets:
+            for strategy in strategies:
+                outputs[strategy] = [anonymized_text for anonymized_text, _ in outputs[strategy]]
+        if return_entities:
+            return outputs, entities
+        return outputs
+
+    def _substitute_missing(self, strategy, texts, pending, missing, all_entities, outputs, cache_keys):
+        """Fill in one strategy's output for the pending documents that were not cached."""
+        pending_texts = [texts[pending[j]] for j in missing]
+        all_bert = {}
+        if strategy == "context_aware":
+            bert_lists = self._bert_replacements_for(pending_texts, [all_entities[j] for j in missing])
+            all_bert = dict(zip(missing, bert_lists))
+        
+        for j in missing:
+            i = pending[j]
+            result = self._substitute(texts[i], all_entities[j], strategy, all_bert.get(j))
+            outputs[strategy][i] = result
+            if (strategy, i) in cache_keys:
+                anonymized_text, offset_map = result
+                self.cache.put(cache_keys[(strategy, i)], {
+                    "text": anonymized_text,
+                    "offsets": [list(m) for m in offset_map],
+                    "entities": [[e.entity_type, e.start, e.end, float(e.score)] for e in all_entities[j]],
+                })
+
+    def _bert_replacements_for(self, texts, all_entities):
+        """Run every masked variant of every document through one batched fill-mask pass."""
+        requests = []
+        for text, entities in zip(texts, all_entities):
+            for entity in self._replacement_order(entities):
+                requests.append((text, entity.start, entity.end, text[entity.start:entity.end]))
+        
+        flat = self.get_bert_replacements(requests)
+        
+        per_doc = []
+        pos = 0
+        for entities in all_entities:
+            per_doc.append(flat[pos:pos + len(entities)])
+            pos += len(entities)
+        return per_doc
+
+    def _replacement_order(self, entities):
+        """Entities are replaced from the end of the text towards the start."""
+        return sorted(entities, key=lambda x: x.start, reverse=True)
+
+    def _substitute(self, text, entities, strategy, bert_replacements=None):
+        """
+        Replace detected entities in text using the given strategy.
+        bert_replacements holds precomputed context-aware replacements in
+        replacement order; they are computed here when not given.
+        
+        Returns:
+            Tuple of (anonymized text, list of SpanMapping)
+        """
         if not entities:
-            return text
+            return text, []
             
-        entities = sorted(entities, key=lambda x: x.start, reverse=True)
-        anonymized_text = text
+        entities = self._replacement_order(entities)
+        if strategy == "semantic" and self.seed is not None:
+            self.faker.seed_instance(f"{self.seed}:{text_hash(text)}")
+        if strategy == "context_aware" and bert_replacements is None:
+            bert_replacements = self._bert_replacements_for([text], [entities])[0]
         
-        for entity in entities:
-            start = entity.start
-            end = entity.end
+        # Replacements are generated end-to-start so Faker draws values in the same order as before
+        replacements = []
+        for i, entity in enumerate(entities):
             entity_type = entity.entity_type
-            original_word = text[start:end]
             
             if strategy == "placeholder":
                 replacement = f"[{entity_type}]"
             elif strategy == "semantic":
                 replacement = self.get_faker_replacement(entity_type)
             elif strategy == "context_aware":
-                replacement = self.get_bert_replacement(text, start, end, original_word)
+                replacement = bert_replacements[i]
             else:
                 replacement = f"[{entity_type}]"
 
+            replacements.append((entity.start, entity.end, replacement, entity_type))
+        
+        replacements.reverse()
+        overlapping = any(prev[1] > cur[0] for prev, cur in zip(replacements, replacements[1:]))
+        if not overlapping:
+            return rewrite_spans(text, replacements)
+        
+        # Overlapping spans keep the old splice semantics; offsets are not meaningful there
+        anonymized_text = text
+        for start, end, replacement, _ in reversed(replacements):
             anonymized_text = anonymized_text[:start] + replacement + anonymized_text[end:]
-            
-        return anonymized_text
\ No newline at end of file
+        return anonymized_text, []
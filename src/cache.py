@@ -0,0 +1,100 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Persistent content-addressed cache for anonymized documents.
+"""
+
+import hashlib
+import json
+import os
+
+
+def text_hash(text):
+    """Return the SHA-256 hex digest of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class AnonymizationCache:
+    """
+    On-disk cache of anonymizer outputs.
+    Each entry is a small JSON file named after the hash of its key, so any
+    change to the key parts (document, strategy, config, seed) is a cache miss.
+    Least recently used entries are evicted once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir="cache/anonymized", max_bytes=512 * 1024 * 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory where entries are stored
+            max_bytes: Size limit for all entries together
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self._entry_paths())
+
+    @staticmethod
+    def make_key(*parts):
+        """Build a cache key from JSON-serializable parts."""
+        return text_hash(json.dumps(parts, sort_keys=True))
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Touch the entry so eviction sees it as recently used. Another process
+        # may have evicted it since it was read, the value is still valid then.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """Store a JSON-serializable value under key."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+
+        self.total_bytes += os.path.getsize(path) - old_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self, target_ratio=0.9):
+        """Delete least recently used entries until the cache is below target_ratio * max_bytes."""
+        entries = []
+        for path in self._entry_paths():
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self.total_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * target_ratio
+        for _, size, path in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entry_paths(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
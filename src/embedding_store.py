@@ -0,0 +1,154 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Memory-mapped on-disk store for document embeddings.
+"""
+
+import json
+import os
+import re
+import time
+import uuid
+import numpy as np
+from src.cache import text_hash
+
+# Shards are merged into one once there are more than this many
+MAX_SHARDS = 32
+
+
+class EmbeddingStore:
+    """
+    Persists document embeddings per embedder as append-only .npy shards.
+    Shards are opened memory-mapped, so only the rows that are actually
+    requested are read from disk. Documents are keyed by their text hash.
+    Every call that encodes new documents adds a shard; when there are more
+    than MAX_SHARDS they are compacted into a single shard.
+    """
+
+    def __init__(self, store_dir, embedder_name, dtype="float32"):
+        """
+        Initialize the store.
+
+        Args:
+            store_dir: Root directory of the store
+            embedder_name: Name of the embedding model (each model has its own folder)
+            dtype: 'float32' or 'float16' storage precision
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", embedder_name)
+        self.path = os.path.join(store_dir, f"{safe_name}_{dtype}")
+        self.dtype = dtype
+        os.makedirs(self.path, exist_ok=True)
+
+        self.shards = []
+        self.shard_names = []
+        self.locations = {}
+        self._load_shards()
+
+    def __len__(self):
+        return len(self.locations)
+
+    def get_embeddings(self, documents, encode_fn):
+        """
+        Return float32 embeddings for documents, encoding only unknown ones.
+
+        Args:
+            documents: List of document texts
+            encode_fn: Function mapping a list of texts to a 2D embedding array
+
+        Returns:
+            Array of shape (len(documents), dim)
+        """
+        hashes = [text_hash(doc) for doc in documents]
+
+        missing = {}
+        for doc, h in zip(documents, hashes):
+            if h not in self.locations and h not in missing:
+                missing[h] = doc
+
+        if missing:
+            print(f"   Embedding store: encoding {len(missing)} new documents ({len(self)} cached).")
+            embeddings = np.asarray(encode_fn(list(missing.values())), dtype="float32")
+            self._write_shard(list(missing.keys()), embeddings)
+
+        if not documents:
+            return np.zeros((0, 0), dtype="float32")
+
+        dim = self.shards[0].shape[1]
+        result = np.empty((len(documents), dim), dtype="float32")
+
+        # Gather rows shard by shard so each memory map is read with one fancy index
+        by_shard = {}
+        for i, h in enumerate(hashes):
+            shard_id, row = self.locations[h]
+            by_shard.setdefault(shard_id, ([], []))
+            by_shard[shard_id][0].append(i)
+            by_shard[shard_id][1].append(row)
+
+        for shard_id, (positions, rows) in by_shard.items():
+            result[positions] = self.shards[shard_id][rows]
+        return result
+
+    def _load_shards(self):
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".keys.json"):
+                continue
+            shard_name = name[:-len(".keys.json")]
+            try:
+                with open(os.path.join(self.path, name), "r", encoding="utf-8") as f:
+                    keys = json.load(f)
+                array = np.load(os.path.join(self.path, f"{shard_name}.npy"), mmap_mode="r")
+            except FileNotFoundError:
+                # Removed by another process compacting the store; its rows are in the merged shard
+                continue
+            self._register(keys, array, shard_name)
+
+    def _write_shard(self, keys, embeddings):
+        # The random suffix keeps names unique between processes writing in the same millisecond
+        shard_name = f"shard_{int(time.time() * 1000):015d}_{uuid.uuid4().hex}"
+        array_path = os.path.join(self.path, f"{shard_name}.npy")
+        keys_path = os.path.join(self.path, f"{shard_name}.keys.json")
+
+        # The keys file is written last, so a shard only becomes visible once it is complete
+        np.save(f"{array_path}.tmp.npy", embeddings.astype(self.dtype))
+        os.replace(f"{array_path}.tmp.npy", array_path)
+        with open(f"{keys_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        os.replace(f"{keys_path}.tmp", keys_path)
+
+        self._register(keys, np.load(array_path, mmap_mode="r"), shard_name)
+        if len(self.shards) > MAX_SHARDS:
+            self.compact()
+
+    def compact(self):
+        """
+        Merge all shards into one. The merged shard is written before the old
+        ones are deleted, so a concurrent reader always finds every row.
+        Shards written by other processes after this store was loaded are kept.
+        """
+        if len(self.shards) <= 1:
+            return
+        keys = list(self.locations)
+        embeddings = np.empty((len(keys), self.shards[0].shape[1]), dtype=self.dtype)
+        for i, key in enumerate(keys):
+            shard_id, row = self.locations[key]
+            embeddings[i] = self.shards[shard_id][row]
+
+        old_names = self.shard_names
+        self.shards, self.shard_names, self.locations = [], [], {}
+        self._write_shard(keys, embeddings)
+        for shard_name in old_names:
+            for suffix in (".keys.json", ".npy"):
+                try:
+                    os.remove(os.path.join(self.path, f"{shard_name}{suffix}"))
+                except FileNotFoundError:
+                    pass
+
+    def _register(self, keys, array, shard_name):
+        shard_id = len(self.shards)
+        self.shards.append(array)
+        self.shard_names.append(shard_name)
+        for row, key in enumerate(keys):
+            self.locations.setdefault(key, (shard_id, row))
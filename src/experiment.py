@@ -0,0 +1,543 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Declarative experiment grid: load data -> anonymize -> embed -> query -> merge.
+"""
+
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from src import instrumentation
+from src.cache import text_hash
+
+ANONYMIZATION_CACHE_DIR = "cache/anonymized"
+EMBEDDING_STORE_DIR = "cache/embeddings"
+GRID_WORK_DIR = "cache/grid"
+FAISS_INDEX_DIR = "cache/faiss"
+FAKER_SEED = 42
+PREPARE_SCOPE = "prepare"
+EMBEDDER_NAME = 'all-MiniLM-L6-v2'
+GENERATOR_NAME = "google/flan-t5-base"
+
+# Strategy name of the unmodified documents
+ORIGINAL = "original"
+DENSE_RETRIEVERS = ("dense_numpy", "dense_faiss", "hybrid")
+# RAGSystem arguments a retriever entry of a config may set
+RETRIEVER_OPTIONS = ("faiss_index_spec", "faiss_metric", "nprobe", "ef_search",
+                     "hybrid_dense", "fusion", "candidate_depth", "rrf_k")
+# Stored once per output folder; result rows reference it by (corpus, doc_id)
+DOCUMENT_TABLE = "documents.parquet"
+# Entities detected in each original document (doc_id, entity_count, spans)
+ENTITY_TABLE = "entities.parquet"
+SNIPPET_LENGTH = 200
+# Environment variables that set the thread pools of OpenMP, MKL and OpenBLAS
+THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+LEGACY_COLUMNS = ["question", "ground_truth", "retrieved_context_snippet"]
+
+
+def part_schema():
+    """Columns of the per-job part files (one row per question)."""
+    import pyarrow as pa
+    return pa.schema([
+        ("question_id", pa.int32()),
+        ("question", pa.string()),
+        ("ground_truth", pa.string()),
+        ("doc_ids", pa.list_(pa.int32())),
+        ("scores", pa.list_(pa.float32())),
+        ("answer", pa.string()),
+    ])
+
+
+def result_schema(answer_column):
+    """
+    Columns of a scenario result file.
+    retrieved_doc_ids/retrieved_scores are in rank order (position 0 is rank 1),
+    doc_id is the top document, the one given to the generator as context,
+    and source_doc_id is the paragraph the question was written for.
+    """
+    import pyarrow as pa
+    labels = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("anonymization_strategy", labels),
+        ("retrieval_method", labels),
+        ("corpus", labels),
+        ("question_id", pa.int32()),
+        ("question", pa.string()),
+        ("ground_truth", pa.string()),
+        ("source_doc_id", pa.int32()),
+        ("doc_id", pa.int32()),
+        ("retrieved_doc_ids", pa.list_(pa.int32())),
+        ("retrieved_scores", pa.list_(pa.float32())),
+        (answer_column, pa.string()),
+    ])
+
+
+def document_schema():
+    """Columns of the document table: the text of every (corpus, doc_id) once."""
+    import pyarrow as pa
+    return pa.schema([
+        ("corpus", pa.dictionary(pa.int32(), pa.string())),
+        ("doc_id", pa.int32()),
+        ("text", pa.string()),
+    ])
+
+
+def load_config(path):
+    """
+    Load a grid config from a JSON file.
+
+    A config lists its scenarios, each with a label (written to the
+    'anonymization_strategy' column), an anonymization strategy ('original'
+    for none), the retrievers to run and an output file. num_samples,
+    output_dir, answer_column, chunk_size and k (documents recorded per
+    question) apply to all of its scenarios. Results are written as Parquet;
+    "csv": true also writes the old CSV layout with 200-character snippets.
+
+    A retriever is a method name ("dense_faiss") or an object with a "name",
+    RAGSystem options (see RETRIEVER_OPTIONS, e.g. "faiss_index_spec": "HNSW32"),
+    an optional "label" for the 'retrieval_method' column and "persist_index"
+    to save the trained FAISS index under cache/faiss/ and reuse it.
+
+    Returns:
+        Config dictionary
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    config.setdefault("num_samples", 500)
+    config.setdefault("output_dir", "data")
+    config.setdefault("answer_column", "model_answer")
+    config.setdefault("chunk_size", 50)
+    config.setdefault("k", 1)
+    config.setdefault("csv", False)
+    for scenario in config["scenarios"]:
+        scenario.setdefault("strategy", ORIGINAL)
+        scenario["retrievers"] = [_retriever_entry(entry) for entry in scenario["retrievers"]]
+    return config
+
+
+def _retriever_entry(entry):
+    """Normalize a retriever entry of a config to a dictionary with name, label and options."""
+    if isinstance(entry, str):
+        entry = {"name": entry}
+    entry = dict(entry)
+    name = entry.pop("name")
+    label = entry.pop("label", name)
+    persist_index = bool(entry.pop("persist_index", False))
+    unknown = sorted(set(entry) - set(RETRIEVER_OPTIONS))
+    if unknown:
+        raise ValueError(f"Unknown options for retriever '{name}': {unknown}")
+    return {"name": name, "label": label, "options": entry, "persist_index": persist_index}
+
+
+def plan_grid(configs, work_dir=GRID_WORK_DIR):
+    """
+    Turn configs into the nodes of the work graph, merging shared nodes.
+
+    Data is loaded once for the largest sample count, every strategy is
+    anonymized once, every (corpus, embedder) pair is embedded once and a
+    (strategy, retriever, retriever options, sample count, chunk size, k)
+    query job is run once even if several scenarios or configs list it.
+    Jobs that differ in any of these (e.g. two FAISS index types) are
+    separate, each with its own part folder.
+
+    Returns:
+        Dictionary with num_samples, strategies, dense_corpora, jobs and outputs
+    """
+    jobs = {}
+    outputs = []
+    for config in configs:
+        n = config["num_samples"]
+        for scenario in config["scenarios"]:
+            parts = []
+            for entry in scenario["retrievers"]:
+                retriever, options = entry["name"], entry["options"]
+                chunk_size, k = config["chunk_size"], config["k"]
+                options_key = json.dumps(options, sort_keys=True)
+                key = (scenario["strategy"], retriever, options_key, entry["persist_index"], n, chunk_size, k)
+                if key not in jobs:
+                    # Non-default options get a short hash in the folder names
+                    suffix = f"_{text_hash(options_key)[:8]}" if options else ""
+                    name = f"{scenario['strategy']}_{retriever}{suffix}_n{n}"
+                    jobs[key] = {
+                        "strategy": scenario["strategy"],
+                        "retriever": retriever,
+                        "options": options,
+                        "scope": f"{scenario['strategy']}/{retriever}{suffix}",
+                        "index_path": os.path.join(FAISS_INDEX_DIR, f"{name}.index") if entry["persist_index"] else None,
+                        "num_samples": n,
+                        "chunk_size": chunk_size,
+                        "k": k,
+                        "part_path": os.path.join(work_dir, f"{name}_c{chunk_size}_k{k}"),
+                    }
+                parts.append((entry["label"], key))
+            # Results are always Parquet; an old ".csv" output name keeps its stem
+            output_name = f"{os.path.splitext(scenario['output'])[0]}.parquet"
+            outputs.append({
+                "path": os.path.join(os.getcwd(), config["output_dir"], output_name),
+                "label": scenario["label"],
+                "corpus": scenario["strategy"],
+                "num_samples": n,
+                "answer_column": config["answer_column"],
+                "csv": config["csv"],
+                "parts": parts,
+            })
+
+    dense_corpora = {}
+    for job in jobs.values():
+        if job["retriever"] in DENSE_RETRIEVERS:
+            dense_corpora[job["strategy"]] = max(dense_corpora.get(job["strategy"], 0), job["num_samples"])
+
+    return {
+        "num_samples": max(config["num_samples"] for config in configs),
+        "strategies": sorted({job["strategy"] for job in jobs.values()} - {ORIGINAL}),
+        "dense_corpora": dense_corpora,
+        "jobs": jobs,
+        "outputs": outputs,
+    }
+
+
+def default_workers(num_jobs, threads_per_worker=4):
+    """Number of worker processes: one per threads_per_worker cores, at most one per job."""
+    return max(1, min(num_jobs, (os.cpu_count() or 1) // threads_per_worker))
+
+
+def num_documents(doc_ids, n):
+    """Size of the document table prefix used by the first n questions."""
+    return max(doc_ids[:n]) + 1 if n > 0 and doc_ids else 0
+
+
+def corpus_hash(documents):
+    """SHA-256 over the doc ids and texts of a corpus."""
+    digest = hashlib.sha256()
+    for doc_id, doc in enumerate(documents):
+        digest.update(f"{doc_id}\0{doc}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _init_worker(threads_per_worker, instrument):
+    """
+    Limit intra-op threads so parallel workers do not oversubscribe the cores.
+    Torch, numpy and FAISS read the thread count from the environment when they
+    are first imported, so a worker that only runs BM25 never imports torch.
+    """
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads_per_worker)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads_per_worker)
+    if instrument:
+        instrumentation.enable()
+
+
+def run_query_job(job, documents, questions, answers, resume=False):
+    """
+    Answer the questions of one (corpus, retriever) job and write its part file.
+
+    Args:
+        job: Job dictionary from plan_grid, with the settings added by _prepare
+        documents: Corpus to retrieve from
+        questions: List of questions
+        answers: Ground truth answers aligned with questions
+        resume: Keep query chunks finished by a previous run
+
+    Returns:
+        Tuple of (part file path, raw timings of the job for instrumentation.merge)
+    """
+    strategy, retriever = job["strategy"], job["retriever"]
+    print(f"\n>>> Running Experiment: Corpus='{strategy}' | Retrieval='{retriever}' (pid {os.getpid()})")
+
+    # Timings go under the job's scope and travel back to the parent with the result
+    job_scope = job["scope"]
+    with instrumentation.scope(job_scope):
+        _answer_questions(job, documents, questions, answers, resume)
+    return job["part_path"], instrumentation.take(job_scope)
+
+
+def _answer_questions(job, documents, questions, answers, resume):
+    """Body of run_query_job: answer the pending query chunks and checkpoint them."""
+    from src.rag_pipeline import RAGSystem
+    from src.pipeline_runner import iter_pipelined
+    from src.checkpoint import CheckpointedParquetWriter
+
+    strategy, retriever = job["strategy"], job["retriever"]
+
+    # Chunks computed from another corpus, other models or another chunk size or k
+    # are discarded instead of resumed
+    writer = CheckpointedParquetWriter(job["part_path"], part_schema(), resume=resume, settings=job["settings"])
+
+    # Units of work are fixed query ranges; finished ones are skipped on --resume
+    chunk_size = job["chunk_size"]
+    chunks = [(start, min(start + chunk_size, len(questions))) for start in range(0, len(questions), chunk_size)]
+    pending = [c for c in chunks if not writer.is_complete(strategy, retriever, *c)]
+    if not pending:
+        print(f"   {strategy}/{retriever}: all queries already finished, skipping.")
+        return
+
+    settings = job["settings"]
+    with RAGSystem(retrieval_method=retriever, model_name=settings["generator"], embedder_name=settings["embedder"],
+                   embedding_store_dir=EMBEDDING_STORE_DIR, **job["options"]) as rag:
+        rag.ingest_documents(documents, index_path=job["index_path"])
+        rag.warmup()
+
+        start_time = time.time()
+
+        # Retrieval of the next chunk overlaps with generation of the current one
+        batches = (questions[start:end] for start, end in pending)
+        answered = iter_pipelined(rag, batches, k=job["k"], with_hits=True)
+        for (start, end), (_, model_preds, hits) in zip(pending, answered):
+            results = []
+            for i, (doc_ids, scores), model_pred in zip(range(start, end), hits, model_preds):
+                results.append({
+                    "question_id": i,
+                    "question": questions[i],
+                    "ground_truth": answers[i],
+                    "doc_ids": doc_ids,
+                    "scores": scores,
+                    "answer": model_pred
+                })
+            writer.write_chunk(strategy, retriever, start, end, results)
+            print(f"   {strategy}/{retriever}: processed {end}/{len(questions)} queries...")
+
+    duration = time.time() - start_time
+    print(f"   {strategy}/{retriever}: finished in {duration:.2f} seconds.")
+
+
+def merge_outputs(output, source_doc_ids, corpora):
+    """
+    Write one scenario file by concatenating the part files of its retrievers.
+
+    Parts are streamed chunk by chunk, so no part is held in memory. The label,
+    retriever and corpus columns are added and the answer column gets the
+    config's name. With output["csv"] the old CSV layout is written as well.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from src.checkpoint import iter_parquet_chunks
+
+    schema = result_schema(output["answer_column"])
+    os.makedirs(os.path.dirname(output["path"]), exist_ok=True)
+    tmp_path = f"{output['path']}.tmp"
+    csv_path = f"{os.path.splitext(output['path'])[0]}.csv"
+    documents = corpora[output["corpus"]]
+
+    with ExitStack() as stack:
+        writer = stack.enter_context(pq.ParquetWriter(tmp_path, schema))
+        csv_writer = None
+        if output["csv"]:
+            csv_writer = csv.writer(stack.enter_context(open(f"{csv_path}.tmp", "w", encoding="utf-8", newline="")),
+                                    lineterminator="\n")
+            csv_writer.writerow(["anonymization_strategy", "retrieval_method"] + LEGACY_COLUMNS + [output["answer_column"]])
+
+        for retriever, job in output["parts"]:
+            for chunk in iter_parquet_chunks(job["part_path"]):
+                n = chunk.num_rows
+                question_ids = chunk.column("question_id").to_pylist()
+                top_ids = [ids[0] if ids else None for ids in chunk.column("doc_ids").to_pylist()]
+                writer.write_table(pa.Table.from_arrays([
+                    pa.DictionaryArray.from_arrays(pa.array([0] * n, pa.int32()), [output["label"]]),
+                    pa.DictionaryArray.from_arrays(pa.array([0] * n, pa.int32()), [retriever]),
+                    pa.DictionaryArray.from_arrays(pa.array([0] * n, pa.int32()), [output["corpus"]]),
+                    chunk.column("question_id"),
+                    chunk.column("question"),
+                    chunk.column("ground_truth"),
+                    pa.array([source_doc_ids[i] for i in question_ids], pa.int32()),
+                    pa.array(top_ids, pa.int32()),
+                    chunk.column("doc_ids"),
+                    chunk.column("scores"),
+                    chunk.column("answer"),
+                ], schema=schema))
+
+                if csv_writer:
+                    for q, truth, doc_id, answer in zip(chunk.column("question").to_pylist(),
+                                                        chunk.column("ground_truth").to_pylist(), top_ids,
+                                                        chunk.column("answer").to_pylist()):
+                        snippet = documents[doc_id][:SNIPPET_LENGTH] if doc_id is not None else ""
+                        csv_writer.writerow([output["label"], retriever, q, truth, snippet, answer])
+    os.replace(tmp_path, output["path"])
+    if output["csv"]:
+        os.replace(f"{csv_path}.tmp", csv_path)
+    print(f"   [SAVED] {output['label']}: {output['path']}")
+
+
+def _documents_needed(outputs, doc_ids):
+    """Per output folder, the number of documents of each corpus its result files reference."""
+    needed_by_dir = {}
+    for output in outputs:
+        needed = needed_by_dir.setdefault(os.path.dirname(output["path"]), {})
+        needed[output["corpus"]] = max(needed.get(output["corpus"], 0), num_documents(doc_ids, output["num_samples"]))
+    return needed_by_dir
+
+
+def write_document_tables(outputs, corpora, doc_ids):
+    """
+    Write the document table of every output folder: the text of each corpus its
+    result files reference, up to the documents used by the largest sample, once.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    needed_by_dir = _documents_needed(outputs, doc_ids)
+
+    schema = document_schema()
+    for folder, needed in needed_by_dir.items():
+        path = os.path.join(folder, DOCUMENT_TABLE)
+        with pq.ParquetWriter(f"{path}.tmp", schema) as writer:
+            # One row group per corpus, so a reader can skip the corpora it does not need
+            for corpus, n in sorted(needed.items()):
+                writer.write_table(pa.Table.from_arrays([
+                    pa.DictionaryArray.from_arrays(pa.array([0] * n, pa.int32()), [corpus]),
+                    pa.array(range(n), pa.int32()),
+                    pa.array(corpora[corpus][:n], pa.string()),
+                ], schema=schema))
+        os.replace(f"{path}.tmp", path)
+        print(f"   [SAVED] Document table: {path}")
+
+
+def write_entity_tables(outputs, entities, doc_ids):
+    """
+    Write the entity table of every output folder, covering the documents its result files use.
+    When nothing was anonymized (entities is None) the table of an earlier run is
+    removed instead, so it can never describe documents of another run.
+    """
+    from src.anonymizer import write_entity_table
+
+    for folder, needed in _documents_needed(outputs, doc_ids).items():
+        path = os.path.join(folder, ENTITY_TABLE)
+        if entities is None:
+            if os.path.exists(path):
+                os.remove(path)
+                print(f"   [REMOVED] Stale entity table: {path}")
+            continue
+        write_entity_table(path, entities[:max(needed.values())])
+        print(f"   [SAVED] Entity table: {path}")
+
+
+def run_grid(configs, resume=False, workers="auto", threads_per_worker=4, instrument=False):
+    """
+    Run every scenario of the given configs, computing shared work once.
+
+    Args:
+        configs: List of config dictionaries (see load_config)
+        resume: Skip query chunks finished by a previous run
+        workers: Number of query worker processes, or 'auto' to size by CPU count
+        threads_per_worker: Intra-op threads (torch, BLAS, OpenMP) per worker process
+        instrument: Record per-stage timings and write them next to the result files
+    """
+    if instrument:
+        instrumentation.enable()
+    with instrumentation.scope(PREPARE_SCOPE):
+        corpora, questions, ground_truths, doc_ids, entities, plan = _prepare(configs)
+    jobs = plan["jobs"]
+
+    # Node 4: independent query jobs, spread over worker processes
+    if workers == "auto":
+        workers = default_workers(len(jobs), threads_per_worker)
+    workers = max(1, min(int(workers), len(jobs) or 1))
+    print(f"\n--- Running {len(jobs)} query jobs on {workers} worker(s) ---")
+
+    def job_args(job):
+        n = job["num_samples"]
+        documents = corpora[job["strategy"]][:num_documents(doc_ids, n)]
+        return job, documents, questions[:n], ground_truths[:n], resume
+
+    start_time = time.time()
+    if workers == 1:
+        results = [run_query_job(*job_args(job)) for job in jobs.values()]
+    else:
+        # Spawned workers: forking a process that already runs torch threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(threads_per_worker, instrumentation.is_enabled())) as pool:
+            futures = [pool.submit(run_query_job, *job_args(job)) for job in jobs.values()]
+            results = [future.result() for future in futures]
+    for _, timings in results:
+        instrumentation.merge(timings)
+    print(f"\nQuery jobs finished in {time.time() - start_time:.2f} seconds.")
+
+    # Node 5: assemble the result files in the layout of the original runners
+    print("\n--- Writing result files ---")
+    for output in plan["outputs"]:
+        merge_outputs({**output, "parts": [(r, jobs[key]) for r, key in output["parts"]]}, doc_ids, corpora)
+    write_document_tables(plan["outputs"], corpora, doc_ids)
+    write_entity_tables(plan["outputs"], entities, doc_ids)
+
+    if instrumentation.is_enabled():
+        _export_timings(plan)
+
+
+def _prepare(configs):
+    """Shared nodes of the grid: load data, anonymize and embed every corpus once."""
+    from src.utils import load_squad_sample, build_document_table
+    from src.anonymizer import Anonymizer
+    from src.embedding_store import EmbeddingStore
+    from src import models
+
+    plan = plan_grid(configs)
+    jobs = plan["jobs"]
+    print(f"\n--- Experiment grid: {len(plan['outputs'])} scenarios, {len(jobs)} unique query jobs ---")
+
+    # Node 1: load data once, for the largest sample count
+    raw_data = load_squad_sample(n=plan["num_samples"])
+    questions = [d['question'] for d in raw_data]
+    ground_truths = [d['answers'] for d in raw_data]
+
+    # Paragraphs are shared by many questions: everything below works on unique documents
+    documents, doc_ids = build_document_table(raw_data)
+    corpora = {ORIGINAL: documents}
+    print(f"{len(questions)} questions use {len(documents)} unique documents.")
+
+    # Node 2: detect PII once and build every strategy that some scenario needs;
+    # the detected entities are kept for the entity table (used by filter_pii_rows.py)
+    entities = None
+    anonymizer_fingerprint = None
+    if plan["strategies"]:
+        anonymizer = Anonymizer(seed=FAKER_SEED, cache_dir=ANONYMIZATION_CACHE_DIR)
+        print("\n--- Preparing Anonymized Datasets ---")
+        print(f"Detecting PII once and generating {', '.join(plan['strategies'])} datasets (This takes time)...")
+        anonymized, entities = anonymizer.anonymize_all(corpora[ORIGINAL], strategies=plan["strategies"],
+                                                        return_entities=True)
+        corpora.update(anonymized)
+        anonymizer_fingerprint = {"seed": FAKER_SEED, **anonymizer.config_fingerprint()}
+
+    # Everything a part file depends on, so --resume never mixes chunks of different runs
+    hashes = {}
+    for job in jobs.values():
+        strategy, n = job["strategy"], job["num_samples"]
+        if (strategy, n) not in hashes:
+            hashes[strategy, n] = corpus_hash(corpora[strategy][:num_documents(doc_ids, n)])
+        job["settings"] = {
+            "chunk_size": job["chunk_size"],
+            "k": job["k"],
+            "corpus": hashes[strategy, n],
+            "embedder": EMBEDDER_NAME,
+            "generator": GENERATOR_NAME,
+            "anonymizer": None if strategy == ORIGINAL else {"strategy": strategy, **anonymizer_fingerprint},
+        }
+
+    # Node 3: embed each corpus once; query workers then only read the memory-mapped store
+    if plan["dense_corpora"]:
+        print("\n--- Embedding corpora ---")
+        embedder = models.get_embedder(EMBEDDER_NAME)
+        store = EmbeddingStore(EMBEDDING_STORE_DIR, EMBEDDER_NAME)
+        for strategy, n in plan["dense_corpora"].items():
+            store.get_embeddings(corpora[strategy][:num_documents(doc_ids, n)], embedder.encode)
+
+    return corpora, questions, ground_truths, doc_ids, entities, plan
+
+
+def _export_timings(plan):
+    """Write timings.json/.csv into every output folder, covering the jobs of its result files."""
+    scopes_by_dir = {}
+    for output in plan["outputs"]:
+        scopes = scopes_by_dir.setdefault(os.path.dirname(output["path"]), {PREPARE_SCOPE})
+        for _, key in output["parts"]:
+            scopes.add(plan["jobs"][key]["scope"])
+
+    for folder, scopes in scopes_by_dir.items():
+        json_path, _ = instrumentation.export(os.path.join(folder, "timings"), scopes)
+        print(f"   [SAVED] Stage timings: {json_path} (+ .csv)")
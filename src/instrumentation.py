@@ -0,0 +1,180 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Low-overhead per-stage latency and throughput instrumentation.
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from array import array
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+# Off unless enabled at runtime or with RAG_INSTRUMENT=1
+_enabled = os.environ.get("RAG_INSTRUMENT", "0") not in ("", "0")
+_lock = threading.Lock()
+_scope = "default"
+# (scope, stage) -> [latencies in seconds, number of items]
+_stats = {}
+_NULL_TIMER = nullcontext()
+
+SUMMARY_COLUMNS = ["scope", "stage", "calls", "items", "total_s", "mean_ms",
+                   "p50_ms", "p95_ms", "p99_ms", "max_ms", "items_per_s"]
+
+
+def enable():
+    """Start recording timings."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stop recording timings (already recorded ones are kept)."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+@contextmanager
+def scope(name):
+    """
+    Attribute timings recorded inside the block to a scope, e.g. 'semantic/dense_numpy'.
+    The scope is process-wide so pipeline and search threads inherit it.
+    """
+    global _scope
+    previous = _scope
+    _scope = name
+    try:
+        yield
+    finally:
+        _scope = previous
+
+
+class _Timer:
+    __slots__ = ("stage", "items", "start")
+
+    def __init__(self, stage, items):
+        self.stage = stage
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.start, self.items)
+        return False
+
+
+def timed(stage, items=1):
+    """
+    Context manager timing one call of a stage that processes `items` items.
+    Returns a shared no-op context while instrumentation is disabled.
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(stage, items)
+
+
+def record(stage, seconds, items=1):
+    """Record one call of a stage."""
+    key = (_scope, stage)
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            entry = _stats[key] = [array("d"), 0]
+        entry[0].append(seconds)
+        entry[1] += items
+
+
+def reset():
+    """Drop all recorded timings."""
+    with _lock:
+        _stats.clear()
+
+
+def take(scope_name):
+    """
+    Remove and return the raw timings of one scope.
+    Used to ship the timings of a worker process back to the parent (see merge).
+    """
+    with _lock:
+        taken = {}
+        for key in [key for key in _stats if key[0] == scope_name]:
+            latencies, items = _stats.pop(key)
+            taken[key] = (list(latencies), items)
+        return taken
+
+
+def merge(raw):
+    """Add raw timings returned by take."""
+    with _lock:
+        for key, (latencies, items) in raw.items():
+            entry = _stats.setdefault(key, [array("d"), 0])
+            entry[0].extend(latencies)
+            entry[1] += items
+
+
+def summary(scopes=None):
+    """
+    Per (scope, stage) statistics.
+
+    Args:
+        scopes: Only include these scopes (None for all)
+
+    Returns:
+        List of dictionaries with SUMMARY_COLUMNS. total_s is the summed call time
+        and items_per_s is items divided by it: the throughput of a single call.
+        Calls that overlap (e.g. several pipeline workers) all add their full
+        duration, so total_s can exceed the wall time and items_per_s then
+        understates the throughput of the stage as a whole
+    """
+    with _lock:
+        entries = [(key, np.frombuffer(latencies, dtype="float64").copy(), items)
+                   for key, (latencies, items) in _stats.items()
+                   if scopes is None or key[0] in scopes]
+
+    rows = []
+    for (scope_name, stage), latencies, items in sorted(entries, key=lambda e: e[0]):
+        total = float(latencies.sum())
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        rows.append({
+            "scope": scope_name,
+            "stage": stage,
+            "calls": len(latencies),
+            "items": items,
+            "total_s": round(total, 6),
+            "mean_ms": round(total / len(latencies) * 1000, 3),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(float(latencies.max()) * 1000, 3),
+            "items_per_s": round(items / total, 2) if total > 0 else None,
+        })
+    return rows
+
+
+def export(path_prefix, scopes=None):
+    """
+    Write the summary to <path_prefix>.json and <path_prefix>.csv.
+
+    Returns:
+        Tuple of (json path, csv path)
+    """
+    rows = summary(scopes)
+    os.makedirs(os.path.dirname(path_prefix) or ".", exist_ok=True)
+
+    json_path, csv_path = f"{path_prefix}.json", f"{path_prefix}.csv"
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+    return json_path, csv_path
@@ -0,0 +1,133 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Process-wide model registry so each model is loaded once and shared.
+Heavy libraries (transformers, sentence-transformers, presidio) are only
+imported when a model that needs them is first requested.
+"""
+
+import threading
+from src import stubs
+
+_models = {}
+_lock = threading.RLock()
+
+# NLP configuration of the Presidio analyzer: a copy of Presidio's default
+# (conf/default.yaml), which AnalyzerEngine() loads when given no engine
+PRESIDIO_NLP_CONFIGURATION = {
+    "nlp_engine_name": "spacy",
+    "models": [{"lang_code": "en", "model_name": "en_core_web_lg"}],
+    "ner_model_configuration": {
+        "model_to_presidio_entity_mapping": {
+            "PER": "PERSON", "PERSON": "PERSON", "NORP": "NRP",
+            "FAC": "LOCATION", "LOC": "LOCATION", "GPE": "LOCATION", "LOCATION": "LOCATION",
+            "ORG": "ORGANIZATION", "ORGANIZATION": "ORGANIZATION",
+            "DATE": "DATE_TIME", "TIME": "DATE_TIME",
+        },
+        "low_confidence_score_multiplier": 0.4,
+        "low_score_entity_names": ["ORG", "ORGANIZATION"],
+        "labels_to_ignore": ["CARDINAL", "EVENT", "LANGUAGE", "LAW", "MONEY", "ORDINAL",
+                             "PERCENT", "PRODUCT", "QUANTITY", "WORK_OF_ART"],
+    },
+}
+
+
+def _get_or_load(key, loader):
+    """Return the cached model for key, calling loader on first use."""
+    with _lock:
+        if key not in _models:
+            _models[key] = loader()
+        return _models[key]
+
+
+def _is_stub(model_name):
+    """Names starting with 'stub' select the offline stand-ins from src.stubs."""
+    return model_name.startswith(stubs.STUB_PREFIX)
+
+
+def get_generator(model_name="google/flan-t5-base"):
+    """
+    Return the shared text2text generator for a model.
+
+    Returns:
+        Tuple of (tokenizer, model, generation pipeline)
+    """
+    def load():
+        if _is_stub(model_name):
+            return stubs.StubTokenizer(), None, stubs.StubGenerator()
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
+        print(f"Loading Generator Model ({model_name})...")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        generator = pipeline("text2text-generation", model=model, tokenizer=tokenizer)
+        return tokenizer, model, generator
+
+    return _get_or_load(("generator", model_name), load)
+
+
+def get_embedder(model_name="all-MiniLM-L6-v2"):
+    """Return the shared SentenceTransformer embedder."""
+    def load():
+        if _is_stub(model_name):
+            return stubs.StubEmbedder()
+        from sentence_transformers import SentenceTransformer
+        print(f"Loading Embedder ({model_name}) for Dense Retrieval...")
+        return SentenceTransformer(model_name)
+
+    return _get_or_load(("embedder", model_name), load)
+
+
+def get_fill_mask(model_name="distilbert-base-uncased"):
+    """Return the shared fill-mask pipeline."""
+    def load():
+        if _is_stub(model_name):
+            return stubs.StubFillMask()
+        from transformers import pipeline
+        print(f"Loading {model_name} for Context-Aware substitution...")
+        return pipeline("fill-mask", model=model_name, device=-1)
+
+    return _get_or_load(("fill_mask", model_name), load)
+
+
+def analyzer_nlp_configuration(name="presidio"):
+    """NLP configuration the analyzer is built with, known without loading it."""
+    if _is_stub(name):
+        return {"models": stubs.StubAnalyzer.nlp_engine.models}
+    return PRESIDIO_NLP_CONFIGURATION
+
+
+def get_analyzer(name="presidio"):
+    """Return the shared Presidio AnalyzerEngine (loads the spaCy model), or the stub analyzer."""
+    def load():
+        if _is_stub(name):
+            return stubs.StubAnalyzer()
+        from presidio_analyzer import AnalyzerEngine
+        from presidio_analyzer.nlp_engine import NlpEngineProvider
+        print("Initializing Presidio Analyzer...")
+        nlp_engine = NlpEngineProvider(nlp_configuration=PRESIDIO_NLP_CONFIGURATION).create_engine()
+        return AnalyzerEngine(nlp_engine=nlp_engine, supported_languages=["en"])
+
+    return _get_or_load(("analyzer", name), load)
+
+
+def get_batch_analyzer(name="presidio"):
+    """Return the batch analyzer wrapping get_analyzer(name) (the stub batches by itself)."""
+    def load():
+        if _is_stub(name):
+            return get_analyzer(name)
+        from presidio_analyzer import BatchAnalyzerEngine
+        return BatchAnalyzerEngine(analyzer_engine=get_analyzer(name))
+
+    return _get_or_load(("batch_analyzer", name), load)
+
+
+def loaded_models():
+    """Return the keys of all models loaded in this process."""
+    with _lock:
+        return list(_models.keys())
+
+
+def clear():
+    """Drop all shared models (they are reloaded on next use)."""
+    with _lock:
+        _models.clear()
@@ -0,0 +1,183 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Streaming experiment runner: query encode -> search -> prompt build -> generate -> sink.
+"""
+
+import queue
+import threading
+
+_END = object()
+# How often blocked queue operations check whether the pipeline was stopped
+_POLL_SECONDS = 0.1
+
+
+class _Failure:
+    """Carries an exception from a stage worker to the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class Stage:
+    """One pipeline step: fn is applied to every micro-batch by `workers` threads."""
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+
+
+class StreamingPipeline:
+    """
+    Runs micro-batches through stages connected by bounded queues.
+    All stages work at the same time, a full queue blocks the stage before it
+    (backpressure), and results are yielded in input order.
+    """
+
+    def __init__(self, stages, queue_size=4):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items):
+        """Yield fn_n(...fn_1(item)) for every item, in input order."""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        # Set when the consumer stops (done, failed or closed early) so no thread stays blocked
+        stop = threading.Event()
+
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], stop), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            next_workers = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            for _ in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], queues[i + 1], remaining, lock, next_workers, stop),
+                    daemon=True
+                ))
+        for thread in threads:
+            thread.start()
+
+        try:
+            # Sink: reorder by sequence number
+            pending = {}
+            next_seq = 0
+            while True:
+                message = queues[-1].get()
+                if message is _END:
+                    break
+                seq, result = message
+                if isinstance(result, _Failure):
+                    raise result.error
+                pending[seq] = result
+                while next_seq in pending:
+                    yield pending.pop(next_seq)
+                    next_seq += 1
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _put(self, out_queue, message, stop):
+        """Put a message, giving up once the pipeline is stopped; returns False if it did."""
+        while not stop.is_set():
+            try:
+                out_queue.put(message, timeout=_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, in_queue, stop):
+        """Next message, or _END once the pipeline is stopped."""
+        while not stop.is_set():
+            try:
+                return in_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _feed(self, items, out_queue, stop):
+        seq = 0
+        try:
+            for item in items:
+                if not self._put(out_queue, (seq, item), stop):
+                    return
+                seq += 1
+        except Exception as e:
+            # A failing input iterable is reported to the consumer like a failing stage
+            self._put(out_queue, (seq, _Failure(e)), stop)
+        finally:
+            for _ in range(self.stages[0].workers):
+                self._put(out_queue, _END, stop)
+
+    def _work(self, stage, in_queue, out_queue, remaining, lock, next_workers, stop):
+        while True:
+            message = self._get(in_queue, stop)
+            if message is _END:
+                break
+            seq, item = message
+            if not isinstance(item, _Failure):
+                try:
+                    item = stage.fn(item)
+                except Exception as e:
+                    item = _Failure(e)
+            if not self._put(out_queue, (seq, item), stop):
+                break
+
+        # The last worker of a stage closes the next queue
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(next_workers):
+                self._put(out_queue, _END, stop)
+
+
+def iter_pipelined(rag, question_batches, k=1, generation_batch_size=16,
+                   encode_workers=1, search_workers=1, prompt_workers=1, generate_workers=1,
+                   queue_size=4, with_hits=False):
+    """
+    Answer batches of questions with a RAGSystem, overlapping retrieval and generation.
+
+    Args:
+        rag: RAGSystem with ingested documents
+        question_batches: Iterable of question lists (one micro-batch each)
+        k: Documents retrieved per question (the first one is used as context)
+        generation_batch_size: Prompts per generator forward pass
+        *_workers: Threads per stage
+        queue_size: Micro-batches buffered between two stages
+        with_hits: Also yield the ranked (document ids, scores) of every question
+
+    Yields:
+        (contexts, answers) for each input batch, in input order,
+        or (contexts, answers, hits) with with_hits
+    """
+    def encode(batch):
+        return batch, rag.encode_queries(batch)
+
+    def search(item):
+        batch, encoded = item
+        scores, indices = rag.search_encoded(encoded, k)
+        contexts = [docs[0] if docs else "" for docs in rag.lookup_documents(indices)]
+        hits = rag.lookup_ids(scores, indices) if with_hits else None
+        return batch, contexts, hits
+
+    def build_prompts(item):
+        batch, contexts, hits = item
+        return contexts, hits, [rag.build_prompt(q, c) for q, c in zip(batch, contexts)]
+
+    def generate(item):
+        contexts, hits, prompts = item
+        answers = rag.generate_from_prompts(prompts, batch_size=generation_batch_size)
+        return (contexts, answers, hits) if with_hits else (contexts, answers)
+
+    pipeline = StreamingPipeline([
+        Stage("encode", encode, encode_workers),
+        Stage("search", search, search_workers),
+        Stage("prompt", build_prompts, prompt_workers),
+        Stage("generate", generate, generate_workers),
+    ], queue_size=queue_size)
+    return pipeline.run(question_batches)
+
@@ -4,88 +4,980 @@ Student ID: 280201055
 RAG (Retrieval-Augmented Generation) System implementation.
 """
 
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
-from rank_bm25 import BM25Okapi
-from sklearn.metrics.pairwise import cosine_similarity
-import nltk
+from src.embedding_store import EmbeddingStore
+from src import models
+from src import instrumentation
 
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+# faiss and scipy are imported where they are used, so e.g. a BM25-only job never loads faiss
+FAISS_METRICS = {
+    'l2': 'METRIC_L2',
+    'ip': 'METRIC_INNER_PRODUCT',
+}
+
+
+def build_faiss_index(embeddings, index_spec="Flat", metric="l2", ids=None):
+    """
+    Build (and train if needed) a FAISS index.
+    
+    Args:
+        embeddings: float32 array of shape (n, d)
+        index_spec: FAISS factory string, e.g. 'Flat', 'IVF64,Flat', 'HNSW32', 'IVF64,PQ16'
+        metric: 'l2' or 'ip' (inner product on L2-normalized vectors, i.e. cosine)
+        ids: Optional int64 ids so vectors can later be added and removed by id.
+            IVF indexes store ids natively; other types are wrapped in an IDMap2
+    
+    Returns:
+        Populated FAISS index
+    """
+    embeddings = prepare_faiss_vectors(embeddings, metric)
+    import faiss
+    index = faiss.index_factory(embeddings.shape[1], index_spec, getattr(faiss, FAISS_METRICS[metric]))
+    if ids is not None and faiss.try_extract_index_ivf(index) is None:
+        index = faiss.IndexIDMap2(index)
+    if not index.is_trained:
+        index.train(embeddings)
+    if ids is not None:
+        index.add_with_ids(embeddings, np.asarray(ids, dtype='int64'))
+    else:
+        index.add(embeddings)
+    return index
+
+
+def prepare_faiss_vectors(vectors, metric):
+    """Convert vectors to contiguous float32, L2-normalized for the 'ip' metric."""
+    vectors = np.ascontiguousarray(np.array(vectors, dtype='float32'))
+    if metric == 'ip':
+        import faiss
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def set_faiss_search_params(index, nprobe=None, ef_search=None):
+    """Apply query-time knobs (nprobe for IVF, efSearch for HNSW) to an index."""
+    import faiss
+    params = faiss.ParameterSpace()
+    if nprobe is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None:
+        params.set_index_parameter(index, "efSearch", ef_search)
+
+
+def benchmark_faiss_indexes(doc_embeddings, query_embeddings, operating_points, k=10):
+    """
+    Compare FAISS index configurations against exact cosine search.
+    
+    Args:
+        doc_embeddings: Document embedding matrix (n, d)
+        query_embeddings: Query embedding matrix (q, d)
+        operating_points: List of dicts with 'index_spec', 'metric' and
+            optional 'nprobe' / 'ef_search'
+        k: Cut-off for recall@k
+    
+    Returns:
+        List of result dictionaries, one per operating point
+    """
+    import faiss
+    docs = prepare_faiss_vectors(doc_embeddings, 'ip')
+    queries = prepare_faiss_vectors(query_embeddings, 'ip')
+    k = min(k, len(docs))
+    
+    # Ground truth: exact cosine ranking (same as the dense_numpy path)
+    exact_scores = queries @ docs.T
+    exact_top_k = np.argsort(exact_scores, axis=1)[:, ::-1][:, :k]
+    
+    results = []
+    built = {}
+    for point in operating_points:
+        spec, metric = point['index_spec'], point.get('metric', 'ip')
+        
+        if (spec, metric) not in built:
+            start = time.perf_counter()
+            index = build_faiss_index(doc_embeddings, spec, metric)
+            built[(spec, metric)] = (index, time.perf_counter() - start)
+        index, build_seconds = built[(spec, metric)]
+        set_faiss_search_params(index, point.get('nprobe'), point.get('ef_search'))
+        
+        search_queries = prepare_faiss_vectors(query_embeddings, metric)
+        latencies = []
+        found = np.empty((len(search_queries), k), dtype='int64')
+        for i in range(len(search_queries)):
+            start = time.perf_counter()
+            _, indices = index.search(search_queries[i:i + 1], k)
+            latencies.append(time.perf_counter() - start)
+            found[i] = indices[0]
+        
+        hits = sum(len(set(exact_top_k[i]) & set(found[i])) for i in range(len(found)))
+        latencies_ms = np.array(latencies) * 1000
+        results.append({
+            "index_spec": spec,
+            "metric": metric,
+            "nprobe": point.get('nprobe'),
+            "ef_search": point.get('ef_search'),
+            f"recall@{k}": hits / (len(found) * k),
+            "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+            "latency_p99_ms": float(np.percentile(latencies_ms, 99)),
+            "qps": len(latencies) / sum(latencies),
+            "index_bytes": int(faiss.serialize_index(index).nbytes),
+            "build_seconds": build_seconds,
+        })
+    return results
+
+
+def l2_normalize(vectors):
+    """Row-normalize vectors to unit length as float32 (zero rows stay zero, like sklearn)."""
+    vectors = np.array(vectors, dtype='float32')
+    norms = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    norms[norms == 0.0] = 1.0
+    vectors /= norms[:, np.newaxis]
+    return vectors
+
+
+def select_top_k(scores, indices, k):
+    """
+    Pick the k best candidates per row, ordered by score (descending).
+    Ties are broken deterministically in favour of the lower document index,
+    the order a stable sort on -scores gives, so tied documents (e.g. all-zero
+    BM25 scores) keep their corpus order.
+    
+    Args:
+        scores: Candidate scores, shape (q, c)
+        indices: Document index of each candidate, shape (q, c)
+        k: Number of results to keep
+    
+    Returns:
+        Tuple of (scores, indices) arrays of shape (q, min(k, c))
+    """
+    order = np.lexsort((indices, -scores), axis=-1)[:, :k]
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+def top_k_candidates(scores, offset, k):
+    """
+    Top-k candidates of one score block (q, b) without sorting the whole block.
+    Rows where the k-th score is tied with scores outside the partition keep
+    all tied entries, so the final tie-break stays exact.
+    """
+    num_cols = scores.shape[1]
+    all_indices = np.broadcast_to(np.arange(offset, offset + num_cols), scores.shape)
+    if k >= num_cols:
+        return scores, all_indices
+    
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    threshold = part_scores.min(axis=1)
+    tied_rows = np.nonzero((scores >= threshold[:, np.newaxis]).sum(axis=1) > k)[0]
+    if len(tied_rows) == 0:
+        return part_scores, part + offset
+    
+    # Rare: ties at the cut-off. Fall back to an exact selection for those rows.
+    cand_scores = part_scores.copy()
+    cand_indices = part + offset
+    for row in tied_rows:
+        row_scores, row_indices = select_top_k(scores[row:row + 1], all_indices[row:row + 1], k)
+        cand_scores[row] = row_scores[0]
+        cand_indices[row] = row_indices[0]
+    return cand_scores, cand_indices
+
+
+class ExactDenseIndex:
+    """
+    Exact cosine-similarity search over a float32 embedding matrix.
+    Documents are normalized once when added; queries are scored with one
+    matrix product per block of documents, so the score matrix never exceeds
+    (num_queries x block_size). The matrix grows in amortized chunks and
+    removed rows are masked until more than half are gone, then compacted.
+    """
+    
+    def __init__(self, embeddings, row_ids=None, block_size=16384):
+        embeddings = l2_normalize(embeddings)
+        capacity = max(len(embeddings), 1)
+        self.block_size = block_size
+        self.embeddings = np.empty((capacity, embeddings.shape[1]), dtype='float32')
+        self.row_ids = np.empty(capacity, dtype='int64')
+        self.alive = np.empty(capacity, dtype=bool)
+        self.positions = {}
+        self.size = 0
+        self.num_removed = 0
+        
+        if row_ids is None:
+            row_ids = np.arange(len(embeddings))
+        self._append(embeddings, row_ids)
+    
+    def __len__(self):
+        return self.size - self.num_removed
+    
+    def add(self, embeddings, row_ids):
+        """Append documents; row_ids must be larger than every existing row id."""
+        self._append(l2_normalize(embeddings), row_ids)
+    
+    def remove(self, row_ids):
+        """Remove documents by row id."""
+        for row in row_ids:
+            position = self.positions.pop(int(row))
+            self.alive[position] = False
+            self.num_removed += 1
+        if self.num_removed > self.size // 2:
+            self._compact()
+    
+    def _append(self, vectors, row_ids):
+        needed = self.size + len(vectors)
+        if needed > len(self.row_ids):
+            capacity = max(needed, 2 * len(self.row_ids))
+            self.embeddings = self._grow(self.embeddings, capacity)
+            self.row_ids = self._grow(self.row_ids, capacity)
+            self.alive = self._grow(self.alive, capacity)
+        
+        self.embeddings[self.size:needed] = vectors
+        self.row_ids[self.size:needed] = row_ids
+        self.alive[self.size:needed] = True
+        for position, row in enumerate(row_ids, start=self.size):
+            self.positions[int(row)] = position
+        self.size = needed
+    
+    def _grow(self, array, capacity):
+        grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+        grown[:self.size] = array[:self.size]
+        return grown
+    
+    def _compact(self):
+        keep = np.nonzero(self.alive[:self.size])[0]
+        self.embeddings[:len(keep)] = self.embeddings[keep]
+        self.row_ids[:len(keep)] = self.row_ids[keep]
+        self.alive[:len(keep)] = True
+        self.size = len(keep)
+        self.num_removed = 0
+        self.positions = {int(row): position for position, row in enumerate(self.row_ids[:self.size])}
+    
+    def search(self, query_vectors, k):
+        """
+        Return the k most similar documents for each query.
+        
+        Returns:
+            Tuple of (scores, row ids) arrays of shape (num_queries, min(k, num_docs));
+            row id -1 marks an empty slot
+        """
+        queries = l2_normalize(query_vectors)
+        best_scores = np.empty((len(queries), 0), dtype='float32')
+        best_positions = np.empty((len(queries), 0), dtype='int64')
+        
+        for start in range(0, self.size, self.block_size):
+            end = min(start + self.block_size, self.size)
+            scores = queries @ self.embeddings[start:end].T
+            if self.num_removed:
+                scores[:, ~self.alive[start:end]] = -np.inf
+            block_scores, block_positions = top_k_candidates(scores, start, k)
+            best_scores, best_positions = select_top_k(
+                np.concatenate([best_scores, block_scores], axis=1),
+                np.concatenate([best_positions, block_positions], axis=1),
+                k
+            )
+        
+        rows = self.row_ids[best_positions]
+        rows[np.isneginf(best_scores)] = -1
+        return best_scores, rows
+
+
+def bm25_tokenize(text):
+    """Tokenizer used for BM25 documents and queries."""
+    return text.lower().split()
+
+
+class BM25Index:
+    """
+    Okapi BM25 over sparse term-document matrices.
+    Postings live in segments (one sparse matrix per batch of added
+    documents). Document frequencies and lengths are updated incrementally,
+    and IDF / length normalization are recomputed only after the corpus
+    changed, so a query only touches the postings of its own terms.
+    Scores follow rank_bm25.BM25Okapi (same k1, b and epsilon handling of
+    negative IDF) over the documents currently in the index. The order of
+    documents with equal scores follows select_top_k, not BM25Okapi.get_top_n.
+    """
+    
+    def __init__(self, tokenized_corpus, row_ids=None, k1=1.5, b=0.75, epsilon=0.25,
+                 query_block_size=256, max_segments=8):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.query_block_size = query_block_size
+        self.max_segments = max_segments
+        self.vocabulary = {}
+        self.segments = []
+        
+        self.doc_freqs = np.zeros(0, dtype='int64')
+        self.doc_lengths = np.zeros(0, dtype='float64')
+        self.alive = np.zeros(0, dtype=bool)
+        self.num_rows = 0
+        self.num_docs = 0
+        self.total_length = 0.0
+        self._stale = True
+        
+        tokenized_corpus = list(tokenized_corpus)
+        if row_ids is None:
+            row_ids = np.arange(len(tokenized_corpus))
+        self.add(tokenized_corpus, row_ids)
+    
+    def add(self, tokenized_docs, row_ids):
+        """Add tokenized documents; row_ids must be larger than every existing row id."""
+        row_ids = np.asarray(row_ids, dtype='int64')
+        if len(row_ids) == 0:
+            return
+        
+        rows, cols, counts = [], [], []
+        lengths = []
+        for local_id, tokens in enumerate(tokenized_docs):
+            lengths.append(len(tokens))
+            term_counts = {}
+            for token in tokens:
+                term_id = self.vocabulary.setdefault(token, len(self.vocabulary))
+                term_counts[term_id] = term_counts.get(term_id, 0) + 1
+            rows.extend([local_id] * len(term_counts))
+            cols.extend(term_counts.keys())
+            counts.extend(term_counts.values())
+        
+        from scipy import sparse
+        cols = np.array(cols, dtype='int64')
+        doc_major = sparse.csr_matrix(
+            (np.array(counts, dtype='float64'), (np.array(rows, dtype='int64'), cols)),
+            shape=(len(row_ids), len(self.vocabulary))
+        )
+        self.segments.append(self._make_segment(row_ids, doc_major))
+        
+        self.doc_freqs = self._resized(self.doc_freqs, len(self.vocabulary))
+        self.doc_freqs[:len(self.vocabulary)] += np.bincount(cols, minlength=len(self.vocabulary))
+        
+        self.num_rows = max(self.num_rows, int(row_ids.max()) + 1)
+        self.doc_lengths = self._resized(self.doc_lengths, self.num_rows)
+        self.alive = self._resized(self.alive, self.num_rows)
+        self.doc_lengths[row_ids] = lengths
+        self.alive[row_ids] = True
+        self.num_docs += len(row_ids)
+        self.total_length += sum(lengths)
+        self._stale = True
+        
+        if len(self.segments) > self.max_segments:
+            self._merge_segments()
+    
+    def remove(self, row_ids):
+        """Remove documents by row id."""
+        for row in row_ids:
+            row = int(row)
+            if row >= self.num_rows or not self.alive[row]:
+                raise KeyError(f"Row {row} is not in the BM25 index")
+            for segment in self.segments:
+                local = np.searchsorted(segment['rows'], row)
+                if local < len(segment['rows']) and segment['rows'][local] == row:
+                    doc_terms = segment['doc_major'].indices[
+                        segment['doc_major'].indptr[local]:segment['doc_major'].indptr[local + 1]
+                    ]
+                    self.doc_freqs[doc_terms] -= 1
+                    break
+            self.alive[row] = False
+            self.num_docs -= 1
+            self.total_length -= self.doc_lengths[row]
+        self._stale = True
+    
+    def _make_segment(self, rows, doc_major):
+        """A segment keeps doc-major postings (for removal) and term-major postings (for scoring)."""
+        return {'rows': rows, 'doc_major': doc_major, 'term_major': doc_major.tocsc()}
+    
+    def _merge_segments(self):
+        """Merge all segments into one, dropping removed documents."""
+        from scipy import sparse
+        vocab_size = len(self.vocabulary)
+        rows, matrices = [], []
+        for segment in self.segments:
+            keep = self.alive[segment['rows']]
+            matrix = segment['doc_major'][keep]
+            matrix.resize((matrix.shape[0], vocab_size))
+            rows.append(segment['rows'][keep])
+            matrices.append(matrix)
+        self.segments = [self._make_segment(np.concatenate(rows), sparse.vstack(matrices, format='csr'))]
+    
+    def _resized(self, array, size):
+        if len(array) >= size:
+            return array
+        grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+    
+    def _refresh(self):
+        """Recompute IDF and length normalization after the corpus changed."""
+        if not self._stale:
+            return
+        doc_freqs = self.doc_freqs[:len(self.vocabulary)]
+        present = doc_freqs > 0
+        
+        # IDF over terms of current documents; negative values become epsilon * average IDF
+        idf = np.log(self.num_docs - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+        average_idf = idf[present].sum() / present.sum() if present.any() else 0.0
+        idf[idf < 0] = self.epsilon * average_idf
+        idf[~present] = 0.0
+        self.idf = idf
+        
+        avgdl = self.total_length / self.num_docs if self.num_docs else 1.0
+        self.length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[:self.num_rows] / avgdl)
+        self._stale = False
+    
+    def _query_matrix(self, tokenized_queries):
+        """Sparse (num_queries x vocabulary) matrix of idf * query term count."""
+        rows, cols = [], []
+        for query_id, tokens in enumerate(tokenized_queries):
+            for token in tokens:
+                term_id = self.vocabulary.get(token)
+                if term_id is not None:
+                    rows.append(query_id)
+                    cols.append(term_id)
+        from scipy import sparse
+        cols = np.array(cols, dtype='int64')
+        matrix = sparse.csr_matrix(
+            (self.idf[cols], (np.array(rows, dtype='int64'), cols)),
+            shape=(len(tokenized_queries), len(self.vocabulary))
+        )
+        matrix.sum_duplicates()
+        return matrix
+    
+    def _score_block(self, tokenized_queries):
+        """Dense (num_queries x num_rows) BM25 scores; removed rows score -inf."""
+        self._refresh()
+        query_matrix = self._query_matrix(tokenized_queries)
+        query_terms = np.unique(query_matrix.indices)
+        query_matrix = query_matrix.tocsc()
+        scores = np.zeros((len(tokenized_queries), self.num_rows))
+        
+        for segment in self.segments:
+            terms = query_terms[query_terms < segment['term_major'].shape[1]]
+            postings = segment['term_major'][:, terms]
+            length_norm = self.length_norm[segment['rows'][postings.indices]]
+            postings.data = postings.data * (self.k1 + 1) / (postings.data + length_norm)
+            scores[:, segment['rows']] = (query_matrix[:, terms] @ postings.T).toarray()
+        
+        scores[:, ~self.alive[:self.num_rows]] = -np.inf
+        return scores
+    
+    def get_scores(self, tokenized_query):
+        """BM25 score of every row for one tokenized query."""
+        return self._score_block([tokenized_query])[0]
+    
+    def search(self, tokenized_queries, k):
+        """
+        Score a batch of tokenized queries and return their top-k documents.
+        
+        Returns:
+            Tuple of (scores, row ids) arrays of shape (num_queries, min(k, num_rows));
+            row id -1 marks an empty slot
+        """
+        all_scores, all_indices = [], []
+        for start in range(0, len(tokenized_queries), self.query_block_size):
+            scores = self._score_block(tokenized_queries[start:start + self.query_block_size])
+            cand_scores, cand_indices = top_k_candidates(scores, 0, k)
+            block_scores, block_indices = select_top_k(cand_scores, cand_indices, k)
+            block_indices[np.isneginf(block_scores)] = -1
+            all_scores.append(block_scores)
+            all_indices.append(block_indices)
+        return np.concatenate(all_scores), np.concatenate(all_indices)
+
+
+def fuse_rankings(rankings, k, method="rrf", rrf_k=60):
+    """
+    Merge the ranked candidate lists of several retrievers.
+    
+    Args:
+        rankings: List of (scores, indices) arrays, one pair per retriever,
+            each of shape (num_queries, depth); index -1 marks an empty slot
+        k: Number of fused results per query
+        method: 'rrf' (sum of 1 / (rrf_k + rank)) or 'score' (sum of
+            per-query min-max normalized scores)
+        rrf_k: Rank offset for reciprocal rank fusion
+    
+    Returns:
+        Tuple of (scores, indices) arrays of shape (num_queries, k), padded with -1
+    """
+    if method not in ("rrf", "score"):
+        raise ValueError(f"Unknown fusion method: {method}")
+    
+    num_queries = len(rankings[0][0])
+    fused_scores = np.full((num_queries, k), -np.inf)
+    fused_indices = np.full((num_queries, k), -1, dtype='int64')
+    
+    for q in range(num_queries):
+        totals = {}
+        for scores, indices in rankings:
+            valid = indices[q] >= 0
+            row_scores, row_indices = scores[q][valid], indices[q][valid]
+            if len(row_indices) == 0:
+                continue
+            
+            if method == "rrf":
+                contributions = 1.0 / (rrf_k + np.arange(1, len(row_indices) + 1))
+            else:
+                low, high = row_scores.min(), row_scores.max()
+                if high > low:
+                    contributions = (row_scores - low) / (high - low)
+                else:
+                    contributions = np.ones(len(row_scores))
+            
+            for doc_id, contribution in zip(row_indices.tolist(), contributions.tolist()):
+                totals[doc_id] = totals.get(doc_id, 0.0) + contribution
+        
+        if not totals:
+            continue
+        doc_ids = np.array(list(totals.keys()), dtype='int64')[np.newaxis]
+        values = np.array(list(totals.values()))[np.newaxis]
+        top_scores, top_indices = select_top_k(values, doc_ids, k)
+        fused_scores[q, :top_scores.shape[1]] = top_scores[0]
+        fused_indices[q, :top_indices.shape[1]] = top_indices[0]
+    
+    return fused_scores, fused_indices
 
 
 class RAGSystem:
     """RAG system supporting multiple retrieval methods."""
     
-    def __init__(self, retrieval_method='dense_faiss', model_name="google/flan-t5-base"):
+    def __init__(self, retrieval_method='dense_faiss', model_name="google/flan-t5-base",
+                 embedder_name='all-MiniLM-L6-v2', embedding_store_dir=None, embedding_dtype="float32",
+                 faiss_index_spec="Flat", faiss_metric="l2", nprobe=None, ef_search=None,
+                 hybrid_dense='dense_numpy', fusion="rrf", candidate_depth=50, rrf_k=60):
         """
         Initialize RAG system.
         
         Args:
-            retrieval_method: 'dense_faiss', 'dense_numpy', or 'sparse_bm25'
+            retrieval_method: 'dense_faiss', 'dense_numpy', 'sparse_bm25', or 'hybrid'
             model_name: Hugging Face model name for text generation
+            embedder_name: SentenceTransformer model for dense retrieval
+            embedding_store_dir: Directory of the persistent embedding store (None disables it)
+            embedding_dtype: Storage precision of the embedding store ('float32' or 'float16')
+            faiss_index_spec: FAISS factory string ('Flat', 'IVF64,Flat', 'HNSW32', 'IVF64,PQ16', ...)
+            faiss_metric: 'l2' or 'ip' (cosine on normalized vectors)
+            nprobe: IVF lists visited per query
+            ef_search: HNSW search depth
+            hybrid_dense: Dense backend used by 'hybrid' ('dense_numpy' or 'dense_faiss')
+            fusion: How 'hybrid' merges results: 'rrf' or 'score'
+            candidate_depth: Candidates each backend contributes to the fusion
+            rrf_k: Rank offset for reciprocal rank fusion
         """
         self.retrieval_method = retrieval_method
+        self.faiss_index_spec = faiss_index_spec
+        self.faiss_metric = faiss_metric
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.fusion = fusion
+        self.candidate_depth = candidate_depth
+        self.rrf_k = rrf_k
         self.documents = []
+        self.doc_ids = []
+        self.row_of_id = {}
+        self.embedder_name = embedder_name
         
-        print(f"Loading Generator Model ({model_name})...")
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-        self.generator = pipeline("text2text-generation", model=self.model, tokenizer=self.tokenizer)
+        if retrieval_method == 'hybrid':
+            self.backends = ['sparse_bm25', hybrid_dense]
+        else:
+            self.backends = [retrieval_method]
+        
+        # Models come from the shared registry on first use (or in warmup), so several
+        # RAGSystems reuse one copy and a BM25-only run never loads the embedder
+        self.model_name = model_name
 
-        if 'dense' in retrieval_method:
-            print("Loading Embedder (MiniLM) for Dense Retrieval...")
-            self.embedder = SentenceTransformer('all-MiniLM-L6-v2')
+        if any('dense' in method for method in self.backends):
             self.index = None
-            self.doc_embeddings = None
-        elif retrieval_method == 'sparse_bm25':
+            self.dense_index = None
+            self.embedding_store = None
+            if embedding_store_dir is not None:
+                self.embedding_store = EmbeddingStore(embedding_store_dir, self.embedder_name, dtype=embedding_dtype)
+        if 'sparse_bm25' in self.backends:
             print("Initializing BM25 for Sparse Retrieval...")
             self.bm25 = None
+        
+        self.pool = None
+        if len(self.backends) > 1:
+            # Backends run side by side; their numeric kernels release the GIL
+            self.pool = ThreadPoolExecutor(max_workers=len(self.backends))
             
-    def ingest_documents(self, documents):
-        """Index documents using the selected retrieval method."""
+    @property
+    def generator(self):
+        return models.get_generator(self.model_name)[2]
+
+    @property
+    def tokenizer(self):
+        return models.get_generator(self.model_name)[0]
+
+    @property
+    def model(self):
+        return models.get_generator(self.model_name)[1]
+
+    @property
+    def embedder(self):
+        return models.get_embedder(self.embedder_name)
+
+    def warmup(self):
+        """Load every model this system uses now instead of on the first query."""
+        models.get_generator(self.model_name)
+        if any('dense' in method for method in self.backends):
+            models.get_embedder(self.embedder_name)
+        return self
+
+    def close(self):
+        """Shut down the thread pool of a hybrid system. Safe to call more than once."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def ingest_documents(self, documents, index_path=None, doc_ids=None):
+        """
+        Index documents using the selected retrieval method.
+        
+        Args:
+            documents: List of document texts
+            index_path: For dense_faiss, a saved index to load instead of
+                building one (it is built and saved there if missing)
+            doc_ids: Stable document ids for add_documents/remove_documents
+                (defaults to positions 0..n-1)
+        """
+        documents = list(documents)
+        if doc_ids is None:
+            doc_ids = list(range(len(documents)))
+        
+        # Internal rows are positions in self.documents; removed rows are set to None
         self.documents = documents
+        self.doc_ids = list(doc_ids)
+        self.row_of_id = {}
+        self._register_ids(self.doc_ids, 0)
+        
+        for method in self.backends:
+            with instrumentation.timed(f"ingest.{method}", len(documents)):
+                self._ingest_backend(method, documents, index_path)
+
+    def add_documents(self, documents, doc_ids=None):
+        """
+        Add documents to the existing indexes without rebuilding them.
+        
+        Args:
+            documents: List of document texts
+            doc_ids: Stable ids of the new documents (defaults to their row numbers)
+        """
+        documents = list(documents)
+        if not self.documents:
+            self.ingest_documents(documents, doc_ids=doc_ids)
+            return
+        
+        first_row = len(self.documents)
+        if doc_ids is None:
+            doc_ids = list(range(first_row, first_row + len(documents)))
+        self._register_ids(doc_ids, first_row)
+        
+        rows = np.arange(first_row, first_row + len(documents), dtype='int64')
+        self.documents.extend(documents)
+        self.doc_ids.extend(doc_ids)
+        
+        for method in self.backends:
+            self._add_to_backend(method, documents, rows)
+
+    def remove_documents(self, doc_ids):
+        """
+        Remove documents by their stable ids.
+        All checks run before any index is touched, so a rejected call
+        leaves every backend unchanged.
+        """
+        doc_ids = list(doc_ids)
+        missing = [doc_id for doc_id in doc_ids if doc_id not in self.row_of_id]
+        if missing:
+            raise KeyError(f"Unknown document ids: {missing}")
+        duplicates = [doc_id for doc_id, count in Counter(doc_ids).items() if count > 1]
+        if duplicates:
+            raise ValueError(f"Duplicate document ids: {duplicates}")
+        for method in self.backends:
+            self._check_removal_supported(method)
         
-        if self.retrieval_method == 'dense_faiss':
-            print(f"Ingesting {len(documents)} documents into FAISS...")
-            embeddings = self.embedder.encode(documents)
-            dimension = embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(dimension)
-            self.index.add(np.array(embeddings).astype('float32'))
+        rows = np.array([self.row_of_id[doc_id] for doc_id in doc_ids], dtype='int64')
+        for method in self.backends:
+            self._remove_from_backend(method, rows)
+        
+        for doc_id, row in zip(doc_ids, rows):
+            del self.row_of_id[doc_id]
+            self.documents[row] = None
+
+    def _register_ids(self, doc_ids, first_row):
+        """Map new document ids to rows, rejecting duplicates."""
+        for row, doc_id in enumerate(doc_ids, start=first_row):
+            if doc_id in self.row_of_id:
+                raise ValueError(f"Duplicate document id: {doc_id}")
+            self.row_of_id[doc_id] = row
+
+    def _add_to_backend(self, method, documents, rows):
+        """Append documents to one retrieval backend."""
+        if method == 'dense_faiss':
+            embeddings = prepare_faiss_vectors(self.encode_documents(documents), self.faiss_metric)
+            self.index.add_with_ids(embeddings, rows)
+        elif method == 'dense_numpy':
+            self.dense_index.add(self.encode_documents(documents), rows)
+        elif method == 'sparse_bm25':
+            self.bm25.add([bm25_tokenize(doc) for doc in documents], rows)
+
+    def _check_removal_supported(self, method):
+        """Raise ValueError if a retrieval backend cannot remove documents."""
+        if method == 'dense_faiss':
+            try:
+                # Removing an empty selection changes nothing, but fails on index types without removal
+                self.index.remove_ids(np.array([], dtype='int64'))
+            except RuntimeError as e:
+                raise ValueError(f"FAISS index '{self.faiss_index_spec}' does not support removal: {e}")
+
+    def _remove_from_backend(self, method, rows):
+        """Delete rows from one retrieval backend."""
+        if method == 'dense_faiss':
+            self.index.remove_ids(rows)
+        elif method == 'dense_numpy':
+            self.dense_index.remove(rows)
+        elif method == 'sparse_bm25':
+            self.bm25.remove(rows)
+
+    def _ingest_backend(self, method, documents, index_path):
+        """Build the index of one retrieval backend."""
+        if method == 'dense_faiss':
+            if index_path is not None and os.path.exists(index_path):
+                if self._saved_fingerprint(index_path) == self._index_fingerprint():
+                    self._read_index(index_path)
+                    return
+                print(f"Saved FAISS index at {index_path} was built for other documents or settings, rebuilding...")
+            print(f"Ingesting {len(documents)} documents into FAISS ({self.faiss_index_spec}, {self.faiss_metric})...")
+            embeddings = self.encode_documents(documents)
+            self.index = build_faiss_index(
+                embeddings, self.faiss_index_spec, self.faiss_metric, ids=np.arange(len(documents))
+            )
+            set_faiss_search_params(self.index, self.nprobe, self.ef_search)
+            if index_path is not None:
+                self.save_index(index_path)
             
-        elif self.retrieval_method == 'dense_numpy':
+        elif method == 'dense_numpy':
             print(f"Encoding {len(documents)} documents for Numpy Exact Search...")
-            self.doc_embeddings = self.embedder.encode(documents)
+            self.dense_index = ExactDenseIndex(self.encode_documents(documents))
             
-        elif self.retrieval_method == 'sparse_bm25':
+        elif method == 'sparse_bm25':
             print(f"Tokenizing {len(documents)} documents for BM25...")
-            tokenized_corpus = [doc.lower().split() for doc in documents]
-            self.bm25 = BM25Okapi(tokenized_corpus)
+            tokenized_corpus = [bm25_tokenize(doc) for doc in documents]
+            self.bm25 = BM25Index(tokenized_corpus)
+
+    def save_index(self, path):
+        """Write the trained FAISS index to disk, with a fingerprint of what it was built from."""
+        import faiss
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        faiss.write_index(self.index, path)
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump(self._index_fingerprint(), f)
+        print(f"   [SAVED] FAISS index saved to: {path}")
+
+    def _index_fingerprint(self):
+        """Embedder, index settings and a hash of the ingested documents and their ids."""
+        digest = hashlib.sha256()
+        for doc_id, doc in zip(self.doc_ids, self.documents):
+            digest.update(f"{doc_id}\0{doc}\0".encode("utf-8"))
+        return {
+            "embedder": self.embedder_name,
+            "index_spec": self.faiss_index_spec,
+            "metric": self.faiss_metric,
+            "documents": digest.hexdigest(),
+        }
+
+    def _saved_fingerprint(self, path):
+        """Fingerprint stored next to a saved index, or None if it is missing or unreadable."""
+        try:
+            with open(f"{path}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load_index(self, path, documents):
+        """
+        Load a FAISS index saved with save_index for the given documents.
+        It is rebuilt (and saved again) if it was built from other documents or settings.
+        """
+        self.ingest_documents(documents, index_path=path)
+
+    def _read_index(self, path):
+        """Read a saved FAISS index matching self.documents."""
+        import faiss
+        index = faiss.read_index(path)
+        if index.ntotal != len(self.documents):
+            raise ValueError(f"Index at {path} holds {index.ntotal} vectors, expected {len(self.documents)}")
+        self.index = index
+        set_faiss_search_params(self.index, self.nprobe, self.ef_search)
+        print(f"Loaded FAISS index from {path}")
+
+    def encode_documents(self, documents):
+        """Embed documents, reusing stored embeddings when an embedding store is configured."""
+        with instrumentation.timed("encode.documents", len(documents)):
+            if self.embedding_store is not None:
+                return self.embedding_store.get_embeddings(documents, self.embedder.encode)
+            # Repeated documents are encoded once
+            unique_docs = list(dict.fromkeys(documents))
+            if len(unique_docs) == len(documents):
+                return self.embedder.encode(documents)
+            position = {doc: i for i, doc in enumerate(unique_docs)}
+            embeddings = np.asarray(self.embedder.encode(unique_docs))
+            return embeddings[[position[doc] for doc in documents]]
 
     def retrieve(self, query, k=1):
         """Retrieve top-k documents most relevant to the query."""
-        if self.retrieval_method == 'dense_faiss':
-            query_vec = self.embedder.encode([query])
-            distances, indices = self.index.search(np.array(query_vec).astype('float32'), k)
-            valid_indices = [idx for idx in indices[0] if idx < len(self.documents) and idx >= 0]
-            return [self.documents[idx] for idx in valid_indices]
-            
-        elif self.retrieval_method == 'dense_numpy':
-            query_vec = self.embedder.encode([query])
-            scores = cosine_similarity(query_vec, self.doc_embeddings)[0]
-            top_k_indices = np.argsort(scores)[::-1][:k]
-            return [self.documents[idx] for idx in top_k_indices]
-            
-        elif self.retrieval_method == 'sparse_bm25':
-            tokenized_query = query.lower().split()
-            return self.bm25.get_top_n(tokenized_query, self.documents, n=k)
+        return self.retrieve_batch([query], k=k)[0]
+
+    def retrieve_batch(self, queries, k=1):
+        """
+        Retrieve top-k documents for many queries at once.
+        Dense methods encode all queries in one call and score them with a
+        single matrix search; BM25 scores the whole batch with one sparse product.
+        
+        Args:
+            queries: List of query strings
+            k: Number of documents per query
+        
+        Returns:
+            List of top-k document lists, one per query
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        
+        _, indices = self.search_batch(queries, k)
+        return self.lookup_documents(indices)
+
+    def lookup_documents(self, indices):
+        """Map rows of result indices to document lists, skipping empty slots and removed documents."""
+        return [
+            [self.documents[idx] for idx in row if 0 <= idx < len(self.documents) and self.documents[idx] is not None]
+            for row in indices
+        ]
+
+    def lookup_ids(self, scores, indices):
+        """
+        Map rows of result indices to (document ids, scores) in rank order,
+        skipping the same slots as lookup_documents.
+        """
+        hits = []
+        for score_row, row in zip(scores, indices):
+            valid = [(self.doc_ids[idx], float(score)) for idx, score in zip(row, score_row)
+                     if 0 <= idx < len(self.documents) and self.documents[idx] is not None]
+            hits.append(([doc_id for doc_id, _ in valid], [score for _, score in valid]))
+        return hits
+
+    def search_batch(self, queries, k=1):
+        """
+        Score a batch of queries with the configured retrieval method.
+        
+        Returns:
+            Tuple of (scores, indices) arrays; higher scores are better and
+            index -1 marks an empty slot
+        """
+        if self.retrieval_method == 'hybrid':
+            depth = max(k, self.candidate_depth)
+            futures = [self.pool.submit(self._encode_and_search, method, queries, depth) for method in self.backends]
+            rankings = [future.result() for future in futures]
+            with instrumentation.timed("search.fusion", len(queries)):
+                return fuse_rankings(rankings, k, method=self.fusion, rrf_k=self.rrf_k)
+        return self.search_encoded(self.encode_queries(queries), k)
+
+    def encode_queries(self, queries):
+        """
+        Query-side encoding step (embedding or tokenization) for every backend.
+        Split from search_encoded so the two can run as separate pipeline stages.
+        """
+        return {method: self._encode_for(method, queries) for method in self.backends}
+
+    def search_encoded(self, encoded, k=1):
+        """Search with queries prepared by encode_queries; returns (scores, indices)."""
+        if self.retrieval_method == 'hybrid':
+            depth = max(k, self.candidate_depth)
+            futures = [self.pool.submit(self._search_encoded, method, encoded[method], depth) for method in self.backends]
+            rankings = [future.result() for future in futures]
+            with instrumentation.timed("search.fusion", len(rankings[0][1])):
+                return fuse_rankings(rankings, k, method=self.fusion, rrf_k=self.rrf_k)
+        return self._search_encoded(self.retrieval_method, encoded[self.retrieval_method], k)
+
+    def _encode_and_search(self, method, queries, k):
+        """Encode and search with one backend (one unit of work for the hybrid thread pool)."""
+        return self._search_encoded(method, self._encode_for(method, queries), k)
+
+    def _encode_for(self, method, queries):
+        """Encode queries for one backend."""
+        with instrumentation.timed(f"encode.{method}", len(queries)):
+            if method == 'dense_faiss':
+                return prepare_faiss_vectors(self.embedder.encode(queries), self.faiss_metric)
+            elif method == 'dense_numpy':
+                return self.embedder.encode(queries)
+            elif method == 'sparse_bm25':
+                return [bm25_tokenize(query) for query in queries]
+            raise ValueError(f"Unknown retrieval method: {method}")
+
+    def _search_encoded(self, method, encoded, k):
+        """Top-k (scores, indices) of one retrieval backend."""
+        with instrumentation.timed(f"search.{method}", len(encoded)):
+            if method == 'dense_faiss':
+                distances, indices = self.index.search(encoded, k)
+                if self.faiss_metric == 'l2':
+                    return -distances, indices
+                return distances, indices
+            elif method == 'dense_numpy':
+                return self.dense_index.search(encoded, k)
+            elif method == 'sparse_bm25':
+                return self.bm25.search(encoded, k)
+            raise ValueError(f"Unknown retrieval method: {method}")
+
+    def build_prompt(self, query, context):
+        """Build the generator prompt for a query and its retrieved context."""
+        return f"Context: {context}\n\nQuestion: {query}\n\nAnswer:"
 
     def generate_answer(self, query, context):
         """Generate answer using LLM based on retrieved context and query."""
-        input_text = f"Context: {context}\n\nQuestion: {query}\n\nAnswer:"
-        results = self.generator(input_text, max_length=64, do_sample=False)
-        return results[0]['generated_text']
\ No newline at end of file
+        input_text = self.build_prompt(query, context)
+        with instrumentation.timed("generate"):
+            results = self.generator(input_text, max_length=64, do_sample=False)
+        return results[0]['generated_text']
+
+    def generate_answers(self, queries, contexts, batch_size=16):
+        """
+        Generate answers for many (query, context) pairs in batches.
+        Prompts are sorted by token length so each batch needs little padding.
+        
+        Args:
+            queries: List of questions
+            contexts: List of retrieved contexts, aligned with queries
+            batch_size: Number of prompts per generation batch
+        
+        Returns:
+            List of answers in the original query order
+        """
+        prompts = [self.build_prompt(q, c) for q, c in zip(queries, contexts)]
+        return self.generate_from_prompts(prompts, batch_size=batch_size)
+
+    def generate_from_prompts(self, prompts, batch_size=16):
+        """Batched generation for prompts built with build_prompt; answers keep prompt order."""
+        if not prompts:
+            return []
+        
+        with instrumentation.timed("generate", len(prompts)):
+            lengths = [len(ids) for ids in self.tokenizer(prompts)['input_ids']]
+            order = sorted(range(len(prompts)), key=lambda i: lengths[i])
+            
+            outputs = self.generator(
+                [prompts[i] for i in order], max_length=64, do_sample=False, batch_size=batch_size
+            )
+        
+        answers = [None] * len(prompts)
+        for i, result in zip(order, outputs):
+            # The pipeline returns one dict per prompt, or a one-item list of dicts
+            if isinstance(result, list):
+                result = result[0]
+            answers[i] = result['generated_text']
+        return answers
\ No newline at end of file
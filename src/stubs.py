@@ -0,0 +1,186 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Deterministic stand-ins for the embedder, generator, analyzer and fill-mask models,
+plus a synthetic SQuAD-like corpus, so benchmarks run offline on CPU.
+"""
+
+import re
+import zlib
+from collections import namedtuple
+from types import SimpleNamespace
+import numpy as np
+
+# Model names starting with this prefix resolve to the stubs in src.models
+STUB_PREFIX = "stub"
+
+_TOKEN_RE = re.compile(r"\w+")
+_ENTITY_RE = re.compile(r"\b[A-Z][a-z]+(?: [A-Z][a-z]+)*")
+
+# Same fields the anonymizer reads from presidio's RecognizerResult
+StubEntity = namedtuple("StubEntity", ["entity_type", "start", "end", "score"])
+
+
+def _stable_hash(token):
+    """Hash that does not change between processes (unlike hash())."""
+    return zlib.crc32(token.encode("utf-8"))
+
+
+class StubEmbedder:
+    """
+    Hashed bag-of-words embedder with the output shape of all-MiniLM-L6-v2.
+    Texts that share words get similar vectors, so retrieval results are meaningful.
+    """
+
+    def __init__(self, dim=384, buckets_per_token=2):
+        self.dim = dim
+        self.buckets_per_token = buckets_per_token
+        self._token_cache = {}
+
+    def _buckets(self, token):
+        entry = self._token_cache.get(token)
+        if entry is None:
+            h = _stable_hash(token)
+            buckets = [(h >> (8 * i)) % self.dim for i in range(self.buckets_per_token)]
+            signs = [1.0 if (h >> (24 + i)) & 1 else -1.0 for i in range(self.buckets_per_token)]
+            entry = self._token_cache[token] = (buckets, signs)
+        return entry
+
+    def encode(self, texts, **kwargs):
+        """Return float32 embeddings of shape (len(texts), dim)."""
+        if isinstance(texts, str):
+            texts = [texts]
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            row = out[i]
+            # Binary bag of words: frequent filler words do not drown out rare ones
+            for token in set(_TOKEN_RE.findall(text.lower())):
+                buckets, signs = self._buckets(token)
+                for bucket, sign in zip(buckets, signs):
+                    row[bucket] += sign
+        # Unit length, like the Normalize layer of all-MiniLM-L6-v2
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+class StubTokenizer:
+    """Whitespace tokenizer returning input ids in the Hugging Face format."""
+
+    def __call__(self, texts, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        return {"input_ids": [[_stable_hash(t) % 32000 for t in text.split()] for text in texts]}
+
+
+class StubGenerator:
+    """Text2text pipeline stand-in: answers with the first words of the prompt's context."""
+
+    def __init__(self, answer_words=3):
+        self.answer_words = answer_words
+
+    def _answer(self, prompt):
+        context = prompt.split("\n\nQuestion:", 1)[0].replace("Context: ", "", 1)
+        return " ".join(context.split()[:self.answer_words])
+
+    def __call__(self, prompts, **kwargs):
+        if isinstance(prompts, str):
+            return [{"generated_text": self._answer(prompts)}]
+        return [{"generated_text": self._answer(p)} for p in prompts]
+
+
+class StubFillMask:
+    """Fill-mask pipeline stand-in; unwraps single-item batches like the real pipeline."""
+
+    VOCAB = ["river", "castle", "council", "harbor", "valley", "empire", "college", "market"]
+
+    def _predict(self, text, top_k):
+        h = _stable_hash(text)
+        return [{"token_str": self.VOCAB[(h + i) % len(self.VOCAB)], "score": 1.0 / (i + 1)} for i in range(top_k)]
+
+    def __call__(self, texts, top_k=5, **kwargs):
+        if isinstance(texts, str):
+            return self._predict(texts, top_k)
+        predictions = [self._predict(text, top_k) for text in texts]
+        return predictions[0] if len(predictions) == 1 else predictions
+
+
+class StubAnalyzer:
+    """
+    Regex PII detector: runs of capitalized words are entities, and the entity
+    type is picked from a hash of the span. Also serves as its own batch analyzer.
+    """
+
+    ENTITY_TYPES = ["PERSON", "GPE", "ORG", "PERSON"]
+    nlp_engine = SimpleNamespace(models=[{"lang_code": "en", "model_name": STUB_PREFIX}])
+
+    def analyze(self, text, language="en", **kwargs):
+        return [
+            StubEntity(self.ENTITY_TYPES[_stable_hash(m.group()) % len(self.ENTITY_TYPES)], m.start(), m.end(), 0.85)
+            for m in _ENTITY_RE.finditer(text)
+        ]
+
+    def analyze_iterator(self, texts, language="en", **kwargs):
+        return [self.analyze(text, language) for text in texts]
+
+
+_FIRST_NAMES = ["Alice", "Omar", "Mei", "Carlos", "Ingrid", "Kwame", "Priya", "Tomas", "Leila", "Hiro"]
+_LAST_NAMES = ["Novak", "Okafor", "Silva", "Tanaka", "Larsen", "Haddad", "Moreau", "Kowalski"]
+_PLACES = ["Denver", "Lagos", "Kyoto", "Porto", "Tromso", "Quito", "Izmir", "Perth"]
+_ORGS = ["Acme Corporation", "Northwind Traders", "Globex", "Initech", "Umbrella Group"]
+_WORDS = (
+    "the of and in to a was is for on as by with from that at his her which an were "
+    "city river university team season government company school album song war "
+    "built founded played released located named won became moved studied led "
+    "north south early late first second new old large small national local"
+).split()
+
+
+def synthetic_squad(n_docs, n_questions=None, seed=0, words_per_doc=120):
+    """
+    Generate a SQuAD-like sample: contexts with names, places and organizations,
+    and 'who/where' questions whose answer appears in their context.
+
+    Args:
+        n_docs: Number of distinct contexts
+        n_questions: Number of questions (default: one per context)
+        seed: Random seed; the same arguments always give the same corpus
+        words_per_doc: Filler words per context
+
+    Returns:
+        List of dictionaries with context, question and answers, like load_squad_sample
+    """
+    rng = np.random.default_rng(seed)
+    n_questions = n_docs if n_questions is None else n_questions
+
+    # Zipf-like filler word frequencies
+    weights = 1.0 / np.arange(1, len(_WORDS) + 1)
+    filler = rng.choice(len(_WORDS), size=(n_docs, words_per_doc), p=weights / weights.sum())
+    people = rng.integers(0, [len(_FIRST_NAMES), len(_LAST_NAMES)], size=(n_docs, 2))
+    places = rng.integers(0, len(_PLACES), size=n_docs)
+    orgs = rng.integers(0, len(_ORGS), size=n_docs)
+    topics = rng.integers(0, 10 ** 6, size=n_docs)
+
+    contexts = []
+    facts = []
+    for i in range(n_docs):
+        person = f"{_FIRST_NAMES[people[i, 0]]} {_LAST_NAMES[people[i, 1]]}"
+        place = _PLACES[places[i]]
+        org = _ORGS[orgs[i]]
+        words = [_WORDS[w] for w in filler[i]]
+        third = len(words) // 3
+        contexts.append(
+            f"Topic{topics[i]} {' '.join(words[:third])} {person} {' '.join(words[third:2 * third])} "
+            f"{place} {' '.join(words[2 * third:])} {org}."
+        )
+        facts.append((person, place, topics[i]))
+
+    doc_for_question = np.arange(n_questions) % n_docs if n_questions <= n_docs else rng.integers(0, n_docs, n_questions)
+    samples = []
+    for q, d in enumerate(doc_for_question):
+        person, place, topic = facts[d]
+        if q % 2 == 0:
+            question, answer = f"Who is associated with topic{topic} here?", person
+        else:
+            question, answer = f"Where did topic{topic} take place?", place
+        samples.append({"context": contexts[d], "question": question, "answers": answer})
+    return samples
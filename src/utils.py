@@ -1,56 +1,120 @@
 """
 Author: Eray Kocabozdoğan
 Student ID: 280201055
-Utility functions for data loading and result saving.
+Utility functions for data loading.
 """
 
 import json
-from datasets import load_dataset
+import os
+from src.cache import text_hash
 
+SQUAD_SNAPSHOT_DIR = "cache/squad"
+TARGET_TRIGGERS = ["who", "where", "which company", "which organization", "which city", "name of"]
 
-def load_squad_sample(n=500):
+
+def _trigger_mask(batch, triggers):
+    """Batched filter: keep questions likely to contain PII."""
+    return [any(trigger in question.lower() for trigger in triggers) for question in batch['question']]
+
+def _first_answer(batch):
+    return {"answer": [answers['text'][0] if answers['text'] else "" for answers in batch['answers']]}
+
+def squad_snapshot_path(split="validation", snapshot_dir=SQUAD_SNAPSHOT_DIR):
+    """Folder of the filtered snapshot; the name changes whenever the trigger list does."""
+    triggers_key = text_hash(json.dumps(TARGET_TRIGGERS))[:12]
+    return os.path.join(snapshot_dir, f"squad_{split}_{triggers_key}")
+
+def build_squad_snapshot(split="validation", snapshot_dir=SQUAD_SNAPSHOT_DIR, num_proc=None):
+    """
+    Filter a SQuAD v1.1 split for PII-heavy questions and save it as a local Arrow snapshot.
+    Only this step needs the Hugging Face hub (or its cache).
+    
+    Args:
+        split: Dataset split to snapshot
+        snapshot_dir: Root folder of the snapshots
+        num_proc: Processes used by the filter (None runs it in this process)
+    
+    Returns:
+        Path of the snapshot
+    """
+    from datasets import load_dataset
+    
+    path = squad_snapshot_path(split, snapshot_dir)
+    print(f"Building local snapshot of SQuAD v1.1 {split} (PII-heavy questions)...")
+    data = load_dataset("squad", split=split)
+    
+    filtered = data.filter(
+        _trigger_mask, batched=True, batch_size=10000, num_proc=num_proc,
+        fn_kwargs={"triggers": TARGET_TRIGGERS}
+    )
+    filtered = filtered.select_columns(["context", "question", "answers"])
+    filtered = filtered.map(_first_answer, batched=True, batch_size=10000, remove_columns=["answers"])
+    filtered = filtered.rename_column("answer", "answers")
+    
+    # Written under a temporary name, so an interrupted build never looks complete
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    filtered.save_to_disk(tmp_path)
+    os.replace(tmp_path, path)
+    print(f"   [SAVED] Snapshot with {len(filtered)} rows: {path}")
+    return path
+
+def open_squad_snapshot(split="validation", snapshot_dir=SQUAD_SNAPSHOT_DIR, num_proc=None):
+    """Return the filtered split as a memory-mapped Dataset, building the snapshot on first use."""
+    from datasets import load_from_disk
+    
+    path = squad_snapshot_path(split, snapshot_dir)
+    if not os.path.exists(path):
+        build_squad_snapshot(split, snapshot_dir, num_proc)
+    return load_from_disk(path)
+
+def load_squad_sample(n=500, split="validation", snapshot_dir=SQUAD_SNAPSHOT_DIR, num_proc=None):
     """
     Load n samples from SQuAD v1.1 validation set.
     Filters for questions likely to contain PII (who, where, which company, etc.).
+    The filtered split is read from a local memory-mapped snapshot, so after
+    the first run no network access is needed.
     
     Args:
         n: Number of samples to load
+        split: Dataset split
+        snapshot_dir: Root folder of the snapshots
+        num_proc: Processes for the filter when the snapshot is built
     
     Returns:
         List of dictionaries containing context, question, and answer
     """
-    print(f"Loading SQuAD v1.1 validation set (Targeting PII-heavy questions)...")
-    data = load_dataset("squad", split="validation")
-    
-    samples = []
-    target_triggers = ["who", "where", "which company", "which organization", "which city", "name of"]
-    
-    for item in data:
-        question_text = item['question'].lower()
-        
-        if any(trigger in question_text for trigger in target_triggers):
-            context = item['context']
-            question = item['question']
-            answer = item['answers']['text'][0] if item['answers']['text'] else ""
-            
-            samples.append({
-                "context": context,
-                "question": question,
-                "answers": answer
-            })
-            
-        if len(samples) >= n:
-            break
-            
+    print(f"Loading SQuAD v1.1 {split} set (Targeting PII-heavy questions)...")
+    dataset = open_squad_snapshot(split, snapshot_dir, num_proc)
+    
+    # One columnar read of the first n rows instead of a Python loop over the split
+    columns = dataset[:min(n, len(dataset))]
+    samples = [
+        {"context": context, "question": question, "answers": answer}
+        for context, question, answer in zip(columns['context'], columns['question'], columns['answers'])
+    ]
+    
     print(f"Loaded {len(samples)} filtered samples.")
     return samples
 
-def save_results(results, filename="data/experiment_results_final.csv"):
-    """Save experiment results to CSV file."""
-    import pandas as pd
-    import os
+def build_document_table(samples):
+    """
+    Deduplicate the contexts of a sample (SQuAD reuses each paragraph for many questions).
+    Documents are keyed by their content hash and numbered in order of first use,
+    so the documents of the first n questions are always a prefix of the table.
+    
+    Args:
+        samples: List of dictionaries from load_squad_sample
     
-    os.makedirs("data", exist_ok=True)
-    df = pd.DataFrame(results)
-    df.to_csv(filename, index=False)
-    print(f"Results saved to {filename}")
\ No newline at end of file
+    Returns:
+        Tuple of (list of unique documents, doc_id of each sample's context)
+    """
+    documents = []
+    id_of_hash = {}
+    doc_ids = []
+    for sample in samples:
+        h = text_hash(sample['context'])
+        if h not in id_of_hash:
+            id_of_hash[h] = len(documents)
+            documents.append(sample['context'])
+        doc_ids.append(id_of_hash[h])
+    return documents, doc_ids
@@ -0,0 +1,10 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Makes the src package importable when pytest is run from any directory.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
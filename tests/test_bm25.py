@@ -0,0 +1,62 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+BM25Index scores against the rank_bm25 reference implementation.
+"""
+
+import random
+import numpy as np
+import pytest
+from src.rag_pipeline import BM25Index
+
+rank_bm25 = pytest.importorskip("rank_bm25")
+
+VOCAB = [f"w{i}" for i in range(40)]
+
+
+def random_corpus(rng, n_docs):
+    # Empty documents and a small vocabulary give negative IDFs and many ties
+    return [[rng.choice(VOCAB) for _ in range(rng.randint(0, 30))] for _ in range(n_docs)]
+
+
+def random_queries(rng, n_queries):
+    return [[rng.choice(VOCAB + ["unseen"]) for _ in range(rng.randint(1, 5))] for _ in range(n_queries)]
+
+
+def test_scores_match_bm25okapi():
+    rng = random.Random(0)
+    corpus = random_corpus(rng, 300)
+    reference = rank_bm25.BM25Okapi(corpus)
+    index = BM25Index(corpus)
+
+    for query in random_queries(rng, 50):
+        np.testing.assert_allclose(index.get_scores(query), reference.get_scores(query), rtol=1e-6, atol=1e-9)
+
+
+def test_scores_match_after_add_and_remove():
+    rng = random.Random(1)
+    corpus = random_corpus(rng, 200)
+    index = BM25Index(corpus[:50], max_segments=2)
+    for start in range(50, 200, 25):
+        index.add(corpus[start:start + 25], np.arange(start, start + 25))
+    removed = set(rng.sample(range(200), 60))
+    index.remove(sorted(removed))
+
+    kept = [i for i in range(200) if i not in removed]
+    reference = rank_bm25.BM25Okapi([corpus[i] for i in kept])
+    for query in random_queries(rng, 30):
+        np.testing.assert_allclose(index.get_scores(query)[kept], reference.get_scores(query), rtol=1e-6, atol=1e-9)
+
+
+def test_search_returns_best_scores_first():
+    rng = random.Random(2)
+    corpus = random_corpus(rng, 100)
+    index = BM25Index(corpus)
+    queries = random_queries(rng, 10)
+
+    scores, rows = index.search(queries, 5)
+    for query, query_scores, query_rows in zip(queries, scores, rows):
+        all_scores = index.get_scores(query)
+        expected = np.argsort(-all_scores, kind="stable")[:5]
+        np.testing.assert_array_equal(query_rows, expected)
+        np.testing.assert_allclose(query_scores, all_scores[expected], rtol=1e-6)
@@ -0,0 +1,68 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+The anonymization cache key follows every setting that changes the output.
+"""
+
+import os
+import pytest
+from src import models
+from src.anonymizer import Anonymizer
+from src.cache import AnonymizationCache
+
+TEXTS = ["Alice Novak moved from Lagos to work at Globex.", "Mei Tanaka studied in Kyoto."]
+
+
+def stub_anonymizer(cache_dir=None, **options):
+    return Anonymizer(seed=42, cache_dir=cache_dir, analyzer_name="stub", fill_mask_model="stub", **options)
+
+
+def cache_entries(cache_dir):
+    return sum(len(files) for _, _, files in os.walk(cache_dir))
+
+
+@pytest.mark.parametrize("setting, value", [
+    ("analyzer_name", "stub-other"),
+    ("fill_mask_model", "stub-other"),
+    ("score_threshold", 0.9),
+    ("target_entities", ["PERSON"]),
+])
+def test_fingerprint_changes_with_the_analyzer_config(setting, value):
+    anonymizer = stub_anonymizer()
+    before = anonymizer.config_fingerprint()
+    setattr(anonymizer, setting, value)
+    assert anonymizer.config_fingerprint() != before
+
+
+def test_fingerprint_does_not_load_the_analyzer():
+    anonymizer = Anonymizer(analyzer_name="presidio")
+    fingerprint = anonymizer.config_fingerprint()
+
+    assert fingerprint["nlp_configuration"] == str(models.PRESIDIO_NLP_CONFIGURATION)
+    assert ("analyzer", "presidio") not in models.loaded_models()
+
+
+def test_make_key_is_stable_and_separates_settings():
+    fingerprint = stub_anonymizer().config_fingerprint()
+    key = AnonymizationCache.make_key("text-hash", "semantic", fingerprint, 42)
+
+    assert key == AnonymizationCache.make_key("text-hash", "semantic", dict(reversed(fingerprint.items())), 42)
+    assert key != AnonymizationCache.make_key("text-hash", "semantic", {**fingerprint, "score_threshold": 0.9}, 42)
+    assert key != AnonymizationCache.make_key("text-hash", "semantic", fingerprint, 43)
+    assert key != AnonymizationCache.make_key("text-hash", "placeholder", fingerprint, 42)
+
+
+def test_changed_config_misses_the_cache(tmp_path):
+    cache_dir = str(tmp_path)
+    first = stub_anonymizer(cache_dir).anonymize_all(TEXTS, strategies=["placeholder"])
+    entries = cache_entries(cache_dir)
+    assert entries > 0
+
+    # Same settings: every document is served from the cache
+    assert stub_anonymizer(cache_dir).anonymize_all(TEXTS, strategies=["placeholder"]) == first
+    assert cache_entries(cache_dir) == entries
+
+    changed = stub_anonymizer(cache_dir)
+    changed.target_entities = ["PERSON"]
+    changed.anonymize_all(TEXTS, strategies=["placeholder"])
+    assert cache_entries(cache_dir) > entries
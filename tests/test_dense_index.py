@@ -0,0 +1,70 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+ExactDenseIndex and select_top_k against a brute-force argsort.
+"""
+
+import numpy as np
+from src.rag_pipeline import ExactDenseIndex, l2_normalize, select_top_k
+
+
+def brute_force(queries, embeddings, k):
+    scores = l2_normalize(queries) @ l2_normalize(embeddings).T
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(scores, order, axis=1), order
+
+
+def test_search_matches_brute_force():
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((1000, 16)).astype("float32")
+    queries = rng.standard_normal((20, 16)).astype("float32")
+
+    # A small block size makes the search merge candidates across many blocks
+    scores, rows = ExactDenseIndex(embeddings, block_size=128).search(queries, 5)
+    expected_scores, expected_rows = brute_force(queries, embeddings, 5)
+    np.testing.assert_array_equal(rows, expected_rows)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+
+def test_search_after_add_and_remove():
+    rng = np.random.default_rng(1)
+    embeddings = rng.standard_normal((300, 8)).astype("float32")
+    queries = rng.standard_normal((10, 8)).astype("float32")
+
+    index = ExactDenseIndex(embeddings[:200], block_size=64)
+    index.add(embeddings[200:], np.arange(200, 300))
+    removed = np.arange(0, 300, 3)
+    index.remove(removed)
+
+    kept = np.setdiff1d(np.arange(300), removed)
+    _, rows = index.search(queries, 7)
+    _, expected = brute_force(queries, embeddings[kept], 7)
+    np.testing.assert_array_equal(rows, kept[expected])
+    assert len(index) == len(kept)
+
+
+def test_ties_go_to_the_lower_index():
+    # Duplicate vectors score the same for every query
+    embeddings = np.repeat(np.eye(4, dtype="float32"), 3, axis=0)
+    queries = np.eye(4, dtype="float32")[[2]]
+
+    _, rows = ExactDenseIndex(embeddings, block_size=4).search(queries, 3)
+    np.testing.assert_array_equal(rows, [[6, 7, 8]])
+
+
+def test_select_top_k_orders_by_score_then_index():
+    scores = np.array([[1.0, 3.0, 3.0, 0.0, 3.0, 2.0]])
+    indices = np.array([[10, 14, 11, 12, 13, 15]])
+
+    top_scores, top_indices = select_top_k(scores, indices, 4)
+    np.testing.assert_array_equal(top_scores, [[3.0, 3.0, 3.0, 2.0]])
+    np.testing.assert_array_equal(top_indices, [[11, 13, 14, 15]])
+
+
+def test_empty_slots_when_k_exceeds_the_corpus():
+    embeddings = np.eye(3, dtype="float32")
+    index = ExactDenseIndex(embeddings)
+    index.remove([0])
+
+    _, rows = index.search(embeddings[:1], 3)
+    assert sorted(rows[0].tolist()) == [-1, 1, 2]
@@ -0,0 +1,69 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+StreamingPipeline ordering, error propagation and thread shutdown.
+"""
+
+import random
+import threading
+import time
+import pytest
+from src.pipeline_runner import Stage, StreamingPipeline
+
+
+def jitter(x):
+    time.sleep(random.random() * 0.005)
+    return x
+
+
+def pipeline_threads_stopped(before):
+    """Whether only the threads that existed before the run are still alive."""
+    return set(threading.enumerate()) <= before
+
+
+def test_results_keep_input_order():
+    pipeline = StreamingPipeline([
+        Stage("double", lambda x: 2 * x, 3),
+        Stage("jitter", jitter, 4),
+        Stage("increment", lambda x: x + 1, 2),
+    ], queue_size=2)
+    assert list(pipeline.run(range(200))) == [2 * i + 1 for i in range(200)]
+
+
+def test_stage_error_is_raised_and_threads_stop():
+    def fail_on_ten(x):
+        if x == 10:
+            raise ValueError("stage failed")
+        return x
+
+    before = set(threading.enumerate())
+    pipeline = StreamingPipeline([Stage("fail", fail_on_ten, 2), Stage("jitter", jitter, 2)], queue_size=2)
+    with pytest.raises(ValueError, match="stage failed"):
+        list(pipeline.run(range(1000)))
+    assert pipeline_threads_stopped(before)
+
+
+def test_input_error_is_raised_and_threads_stop():
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError("input failed")
+
+    before = set(threading.enumerate())
+    pipeline = StreamingPipeline([Stage("identity", lambda x: x, 2)])
+    results = pipeline.run(items())
+    assert next(results) == 1
+    assert next(results) == 2
+    with pytest.raises(RuntimeError, match="input failed"):
+        next(results)
+    assert pipeline_threads_stopped(before)
+
+
+def test_closing_early_stops_threads():
+    before = set(threading.enumerate())
+    # Small queues keep the feeder and workers blocked on full queues when the consumer stops
+    pipeline = StreamingPipeline([Stage("jitter", jitter, 2), Stage("identity", lambda x: x, 2)], queue_size=1)
+    results = pipeline.run(iter(range(10 ** 6)))
+    assert [next(results) for _ in range(3)] == [0, 1, 2]
+    results.close()
+    assert pipeline_threads_stopped(before)
@@ -0,0 +1,61 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+RAGSystem.remove_documents validates the whole request before changing any index.
+"""
+
+import pytest
+from src.rag_pipeline import RAGSystem
+from src.stubs import synthetic_squad
+
+DOCUMENTS = [sample["context"] for sample in synthetic_squad(40, seed=0)]
+DOC_IDS = [f"doc{i}" for i in range(len(DOCUMENTS))]
+QUERIES = [sample["question"] for sample in synthetic_squad(40, seed=0)[:10]]
+
+
+def build(retrieval_method, **options):
+    rag = RAGSystem(retrieval_method=retrieval_method, model_name="stub", embedder_name="stub", **options)
+    rag.ingest_documents(DOCUMENTS, doc_ids=DOC_IDS)
+    return rag
+
+
+def snapshot(rag):
+    """Everything a rejected removal must leave untouched."""
+    return list(rag.documents), dict(rag.row_of_id), rag.lookup_ids(*rag.search_batch(QUERIES, 5))
+
+
+@pytest.mark.parametrize("retrieval_method", ["dense_numpy", "sparse_bm25", "hybrid"])
+@pytest.mark.parametrize("doc_ids, error", [
+    (["doc1", "missing"], KeyError),
+    (["doc1", "doc2", "doc1"], ValueError),
+])
+def test_invalid_requests_change_nothing(retrieval_method, doc_ids, error):
+    with build(retrieval_method) as rag:
+        before = snapshot(rag)
+        with pytest.raises(error):
+            rag.remove_documents(doc_ids)
+        assert snapshot(rag) == before
+
+
+def test_unsupported_backend_changes_no_other_backend():
+    pytest.importorskip("faiss")
+    # BM25 supports removal, the HNSW index does not: neither may change
+    with build("hybrid", hybrid_dense="dense_faiss", faiss_index_spec="HNSW32") as rag:
+        before = snapshot(rag)
+        with pytest.raises(ValueError, match="does not support removal"):
+            rag.remove_documents(["doc1"])
+        assert snapshot(rag) == before
+
+
+@pytest.mark.parametrize("retrieval_method", ["dense_numpy", "sparse_bm25", "hybrid"])
+def test_removed_documents_are_never_retrieved(retrieval_method):
+    with build(retrieval_method) as rag:
+        removed = DOC_IDS[::3]
+        rag.remove_documents(removed)
+
+        hits = rag.lookup_ids(*rag.search_batch(QUERIES, 10))
+        retrieved = {doc_id for doc_ids, _ in hits for doc_id in doc_ids}
+        assert retrieved
+        assert not retrieved & set(removed)
+        with pytest.raises(KeyError):
+            rag.remove_documents(removed[:1])
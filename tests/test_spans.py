@@ -0,0 +1,66 @@
+"""
+Author: Eray Kocabozdoğan
+Student ID: 280201055
+Single-pass span rewriting and mapping anonymized spans back to the original text.
+"""
+
+from src.anonymizer import Anonymizer, map_span_to_original, rewrite_spans
+
+TEXT = "Alice Novak moved from Lagos to work at Globex in 2019."
+REPLACEMENTS = [
+    (TEXT.index(entity), TEXT.index(entity) + len(entity), f"<{entity_type}>", entity_type)
+    for entity, entity_type in [("Alice Novak", "PERSON"), ("Lagos", "GPE"), ("Globex", "ORG")]
+]
+
+
+def test_rewrite_spans_builds_the_text_and_offset_map():
+    rewritten, offset_map = rewrite_spans(TEXT, REPLACEMENTS)
+
+    assert rewritten == "<PERSON> moved from <GPE> to work at <ORG> in 2019."
+    for mapping, (start, end, replacement, entity_type) in zip(offset_map, REPLACEMENTS):
+        assert TEXT[mapping.orig_start:mapping.orig_end] == TEXT[start:end]
+        assert rewritten[mapping.new_start:mapping.new_end] == replacement
+        assert mapping.entity_type == entity_type
+
+
+def test_unchanged_text_maps_back_to_itself():
+    rewritten, offset_map = rewrite_spans(TEXT, REPLACEMENTS)
+
+    for word in ["moved from", "to work at", "in 2019."]:
+        start = rewritten.index(word)
+        orig_start, orig_end = map_span_to_original(offset_map, start, start + len(word))
+        assert TEXT[orig_start:orig_end] == word
+
+
+def test_replacements_map_back_to_the_original_entity():
+    rewritten, offset_map = rewrite_spans(TEXT, REPLACEMENTS)
+
+    for mapping in offset_map:
+        assert map_span_to_original(offset_map, mapping.new_start, mapping.new_end) == (mapping.orig_start, mapping.orig_end)
+        # A span inside a replacement snaps to the boundaries of the whole entity
+        assert map_span_to_original(offset_map, mapping.new_start + 1, mapping.new_end - 1) == (mapping.orig_start, mapping.orig_end)
+
+    start = rewritten.index("<GPE> to work")
+    orig_start, orig_end = map_span_to_original(offset_map, start, start + len("<GPE> to work"))
+    assert TEXT[orig_start:orig_end] == "Lagos to work"
+
+
+def test_empty_replacement_and_no_replacements():
+    rewritten, offset_map = rewrite_spans(TEXT, [(0, 12, "", "PERSON")])
+    assert rewritten == TEXT[12:]
+    assert map_span_to_original(offset_map, 0, 5) == (0, 17)
+
+    assert rewrite_spans(TEXT, []) == (TEXT, [])
+    assert map_span_to_original([], 3, 9) == (3, 9)
+
+
+def test_anonymize_offsets_round_trip():
+    anonymizer = Anonymizer(seed=42, analyzer_name="stub", fill_mask_model="stub")
+    for strategy in ["placeholder", "semantic"]:
+        rewritten, offset_map = anonymizer.anonymize(TEXT, strategy=strategy, return_offsets=True)
+        assert offset_map
+        for mapping in offset_map:
+            assert map_span_to_original(offset_map, mapping.new_start, mapping.new_end) == (mapping.orig_start, mapping.orig_end)
+        start = rewritten.index("moved from")
+        orig_start, orig_end = map_span_to_original(offset_map, start, start + len("moved from"))
+        assert TEXT[orig_start:orig_end] == "moved from"